@@ -1,56 +1,131 @@
 import pandas as pd
 import numpy as np
+import argparse
 import ast
+import functools
+import logging
+import sys
 from datetime import datetime
+from pandas.tseries.api import guess_datetime_format
 
+import climate_kernels
+from climate_rollup import RegionDayRollup
+from climate_rolling import add_rolling_features
+from climate_schema import MemoryBudget, apply_schema
+from climate_stats import WelfordStats
 
-def analyze_climate_data(climate_data):
-    df = pd.DataFrame(climate_data)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df.set_index('timestamp').sort_index()
-    df['month'] = df.index.month
-    df['day'] = df.index.day
-    df['hour'] = df.index.hour
 
-    def calc_feels_like(row):
-        temp, wind = row['temperature'], row['wind_speed']
-        if temp < 10 and wind > 5:
-            v = wind ** 0.16
-            return 13.12 + 0.6215 * temp - 11.37 * v + 0.3965 * temp * v
-        return temp
-
-    df['feels_like'] = df.apply(calc_feels_like, axis=1)
-
-    def calc_heat_index(row):
-        temp, hum = row['temperature'], row['humidity']
-        if temp > 25 and hum > 40:
-            return -8.784 + 1.61 * hum + 2.338 * temp - 0.14 * hum * temp
-        return temp
-
-    df['heat_index'] = df.apply(calc_heat_index, axis=1)
-
-    def get_weather_cond(row):
-        precip = row['precipitation']
-        if precip > 10:
-            return 'Storm'
-        if precip > 0:
-            return 'Rain'
-        if row['wind_speed'] > 20:
-            return 'Windy'
-        if row['humidity'] > 85:
-            return 'Humid'
-        return 'Clear'
-
-    df['weather_condition'] = df.apply(get_weather_cond, axis=1)
-
-    def mode_safe(x):
-        if x.empty or pd.isna(x).all():
-            return np.nan
-        m = x.mode()
-        if m.empty:
-            return x.dropna().iloc[0]
-        return m.iloc[0]
+def mode_safe(x):
+    if x.empty or pd.isna(x).all():
+        return np.nan
+    m = x.mode()
+    if m.empty:
+        return x.dropna().iloc[0]
+    return m.iloc[0]
+
+
+def grouped_mode(codes, n_groups, values):
+    # mode_safe for every group at once: values are encoded as integer codes in
+    # sorted order so argmax over the per-group counts picks the first mode in
+    # sorted order, groups without any non-null value get NaN
+    codes = np.asarray(codes)
+    value_codes, uniques = pd.factorize(values, sort=True)
+    result = np.full(n_groups, np.nan, dtype=object)
+    valid = (codes >= 0) & (value_codes >= 0)
+    k = len(uniques)
+    if not valid.any():
+        return result
+    if climate_kernels.compiled() and n_groups * k <= 1 << 24:
+        best = climate_kernels.mode_codes(codes, n_groups, value_codes, k)
+        groups = np.flatnonzero(best >= 0)
+        result[groups] = np.asarray(uniques, dtype=object)[best[groups]]
+        return result
+    pairs = codes[valid].astype(np.int64) * k + value_codes[valid]
+    if n_groups * k <= 1 << 24:
+        counts = np.bincount(pairs, minlength=n_groups * k).reshape(n_groups, k)
+        best = counts.argmax(axis=1)
+        found = counts[np.arange(n_groups), best] > 0
+        groups = np.flatnonzero(found)
+        best = best[found]
+    else:
+        # too many groups x categories for a dense table, count the pairs sparsely
+        pairs, counts = np.unique(pairs, return_counts=True)
+        order = np.lexsort((pairs % k, -counts, pairs // k))
+        pairs = pairs[order]
+        first = np.r_[True, pairs[1:] // k != pairs[:-1] // k]
+        groups, best = pairs[first] // k, pairs[first] % k
+    result[groups] = np.asarray(uniques, dtype=object)[best]
+    return result
+
+
+def group_codes(grouped):
+    return grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+
+
+# name -> (func, hourly aggregation); func takes a mapping of column name to
+# numpy array and returns one value per reading
+DERIVED_METRICS = {}
+
+
+def derived_metric(name, agg='mean'):
+    def register(func):
+        DERIVED_METRICS[name] = (func, agg)
+        return func
+    return register
+
+
+class _Columns(dict):
+    # column arrays are pulled from the frame once and shared by every metric,
+    # metrics registered later can also read the outputs of earlier ones
+    def __init__(self, df):
+        super().__init__()
+        self.df = df
+
+    def __missing__(self, key):
+        values = self[key] = self.df[key].to_numpy()
+        return values
 
+
+@derived_metric('feels_like')
+def calc_feels_like(cols):
+    temp, wind = cols['temperature'], cols['wind_speed']
+    mask = (temp < 10) & (wind > 5)
+    out = np.array(temp, dtype=float)
+    # the vectorized np.power can differ from the scalar pow in the last bit,
+    # readings repeat a lot so the scalar pow over unique speeds stays cheap
+    speeds, inverse = np.unique(wind[mask], return_inverse=True)
+    v = np.array([float(s) ** 0.16 for s in speeds])[inverse]
+    t = out[mask]
+    out[mask] = 13.12 + 0.6215 * t - 11.37 * v + 0.3965 * t * v
+    return out
+
+
+@derived_metric('heat_index')
+def calc_heat_index(cols):
+    temp, hum = cols['temperature'], cols['humidity']
+    return np.where((temp > 25) & (hum > 40), -8.784 + 1.61 * hum + 2.338 * temp - 0.14 * hum * temp, temp)
+
+
+@derived_metric('weather_condition', agg=mode_safe)
+def get_weather_cond(cols):
+    precip, wind, hum = cols['precipitation'], cols['wind_speed'], cols['humidity']
+    return np.select(
+        [precip > 10, precip > 0, wind > 20, hum > 85],
+        np.array(['Storm', 'Rain', 'Windy', 'Humid'], dtype=object),
+        default='Clear',
+    )
+
+
+def compute_derived_metrics(df, metrics=None):
+    cols = _Columns(df)
+    for name in metrics or DERIVED_METRICS:
+        func, _ = DERIVED_METRICS[name]
+        cols[name] = func(cols)
+        df[name] = cols[name]
+    return df
+
+
+def hourly_agg_dict():
     agg_dict = {
         'station_id': 'first',
         'region': 'first',
@@ -60,80 +135,170 @@ def analyze_climate_data(climate_data):
         'pressure': 'mean',
         'precipitation': 'sum',
         'wind_speed': 'max',
-        'feels_like': 'mean',
-        'heat_index': 'mean',
         'month': 'first',
         'day': 'first',
         'hour': 'first',
         'wind_direction': mode_safe,
-        'weather_condition': mode_safe,
     }
+    agg_dict.update((name, agg) for name, (_, agg) in DERIVED_METRICS.items())
+    return agg_dict
 
-    hourly_dfs = []
-    for station_id, group in df.groupby('station_id'):
-        group_resampled = group.resample('h').agg(agg_dict)
-        group_resampled['station_id'] = station_id
-        hourly_dfs.append(group_resampled)
 
-    hourly_df = pd.concat(hourly_dfs).sort_index()
+def fill_empty_hours(hourly, agg_dict):
+    # hourly is indexed by (station_id, timestamp) and sorted; every station gets
+    # a row for each hour between its first and last reading like resample('h')
+    stations = hourly.index.get_level_values(0)
+    hours = hourly.index.get_level_values(1)
+    values = (hours if hours.tz is None else hours.tz_convert(None)).values
+    step = np.timedelta64(1, 'h')
+    starts = np.flatnonzero(np.r_[True, stations[1:] != stations[:-1]])
+    ends = np.r_[starts[1:], len(hourly)] - 1
+    counts = (values[ends] - values[starts]) // step + 1
+    if counts.sum() == len(hourly):
+        return hourly
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    full_hours = pd.DatetimeIndex(np.repeat(values[starts], counts) + offsets * step, name=hours.name)
+    if hours.tz is not None:
+        full_hours = full_hours.tz_localize('UTC').tz_convert(hours.tz)
+    full = pd.MultiIndex.from_arrays([np.repeat(stations[starts], counts), full_hours], names=hourly.index.names)
+    missing = ~full.isin(hourly.index)
+    hourly = hourly.reindex(full)
+    for col, agg in agg_dict.items():
+        if agg in ('sum', 'count', 'size') and col in hourly:
+            hourly.loc[missing, col] = 0
+    return hourly
 
-    def window_diff(window):
-        n = len(window)
-        if n > 1:
-            return window.iloc[-1] - window.iloc[0]
-        return 0.0
 
-    def window_rate(window):
-        n = len(window)
-        if n > 1:
-            return (window.iloc[-1] - window.iloc[0]) / (n - 1)
-        return 0.0
+def hourly_resample(df, agg_dict=None):
+    agg_dict = agg_dict or hourly_agg_dict()
+    df = df[df['station_id'].notna()]
+    grouped = df.groupby([df['station_id'], df.index.floor('h')], sort=True, observed=True)
+    codes = None
+    columns = {}
+    for col, agg in agg_dict.items():
+        if col == 'station_id':
+            continue
+        if agg is mode_safe:
+            if codes is None:
+                codes = group_codes(grouped)
+            columns[col] = grouped_mode(codes, grouped.ngroups, df[col])
+        elif climate_kernels.compiled() and agg in ('sum', 'mean', 'max') and df[col].dtype == np.float64:
+            if codes is None:
+                codes = group_codes(grouped)
+            columns[col] = climate_kernels.group_aggregate(codes, grouped.ngroups, df[col].to_numpy(), agg)
+        else:
+            columns[col] = grouped[col].agg(agg)
+    hourly = pd.DataFrame(columns, index=grouped.size().index)
+    hourly = fill_empty_hours(hourly, agg_dict)
+    hourly.insert(0, 'station_id', hourly.index.get_level_values(0))
+    hourly = hourly.reset_index(level=0, drop=True)
+    return hourly.sort_index(kind='stable')
 
-    hourly_df['temperature_trend'] = hourly_df.groupby('station_id')['temperature'].transform(
-        lambda x: x.rolling(3, min_periods=1).apply(window_diff, raw=False)
-    )
 
-    hourly_df['pressure_change_rate'] = hourly_df.groupby('station_id')['pressure'].transform(
-        lambda x: x.rolling(3, min_periods=1).apply(window_rate, raw=False)
-    )
+# smallest epoch magnitude taken as each unit, so seconds, milliseconds,
+# microseconds and nanoseconds since 1970 are all read as dates after ~1973
+EPOCH_UNITS = [(1e17, 'ns'), (1e14, 'us'), (1e11, 'ms'), (0, 's')]
+
+
+def guess_timestamp_format(values):
+    sample = values[pd.notna(values)][:1]
+    if not len(sample):
+        return None
+    return guess_datetime_format(str(sample[0]))
+
+
+def to_timestamps(values, fmt=None):
+    # epoch numbers convert without any string parsing; strings are parsed once
+    # per distinct value (stations report on the same minutes) with an exact
+    # format, declared or guessed from the first value, falling back to
+    # pandas' per-value inference when the strings do not share that format
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        largest = values.abs().max()
+        if pd.isna(largest):
+            return pd.to_datetime(values, unit='s')  # empty or all missing
+        unit = next(unit for bound, unit in EPOCH_UNITS if largest >= bound)
+        return pd.to_datetime(values, unit=unit)
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques, dtype=object)
+    fmt = fmt or guess_timestamp_format(uniques)
+    try:
+        parsed = pd.to_datetime(uniques, format=fmt) if fmt else pd.to_datetime(uniques)
+    except (ValueError, TypeError):
+        parsed = pd.to_datetime(uniques)
+    parsed = pd.DatetimeIndex(parsed).take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(parsed, index=values.index, name=values.name)
 
-    station_stats = hourly_df.groupby('station_id')['temperature'].agg(['mean', 'std']).reset_index()
-    hourly_df = hourly_df.reset_index().merge(station_stats, on='station_id').set_index('timestamp')
-    hourly_df['std'] = hourly_df['std'].replace(0, 1e-6)
-    hourly_df['temperature_anomaly'] = np.abs(hourly_df['temperature'] - hourly_df['mean']) > 2 * hourly_df['std']
 
+def parse_timestamps(df, fmt=None):
+    df['timestamp'] = to_timestamps(df['timestamp'], fmt)
+    df = df.set_index('timestamp').sort_index()
+    df['month'] = df.index.month
+    df['day'] = df.index.day
+    df['hour'] = df.index.hour
+    return df
+
+
+def prepare_readings(df, timestamp_format=None):
+    return apply_schema(compute_derived_metrics(parse_timestamps(df, timestamp_format)))
+
+
+def add_temperature_anomaly(hourly_df, station_stats=None):
+    # station_stats can be merged from other partitions or time windows,
+    # by default they come from the rows of hourly_df
+    if station_stats is None:
+        station_stats = WelfordStats.from_values(hourly_df['station_id'], hourly_df['temperature'])
+    mean, std = station_stats.broadcast(hourly_df['station_id'])
+    hourly_df['mean'] = mean
+    hourly_df['std'] = np.where(std == 0, 1e-6, std)
+    hourly_df['temperature_anomaly'] = np.abs(hourly_df['temperature'].to_numpy() - mean) > 2 * hourly_df['std'].to_numpy()
+    return hourly_df
+
+
+def regional_rollup(hourly_df):
     hourly_df['date'] = hourly_df.index.date
+    return RegionDayRollup.from_hourly(hourly_df).finalize()
+
+
+def normalize(series, bounds=None):
+    min_val, max_val = bounds if bounds is not None else (series.min(), series.max())
+    if max_val == min_val:
+        return pd.Series(0.0, index=series.index)
+    return round((series - min_val) / (max_val - min_val), 2)
 
-    grouped = hourly_df.groupby(['region', 'date']).agg(
-        daily_temp_range=('temperature', lambda x: round(x.max() - x.min(), 2)),
-        precip_total=('precipitation', 'sum'),
-        hours_with_precip=('precipitation', lambda x: (x > 0).sum()),
-        wind_direction_mode=('wind_direction', mode_safe),
-        avg_wind_speed=('wind_speed', lambda x: round(x.mean(), 2))
-    ).reset_index()
 
+# columns scaled by normalize() over the whole region/day table
+NORMALIZED_COLUMNS = ('daily_temp_range', 'precipitation_intensity', 'avg_wind_speed')
+
+
+def add_precipitation_intensity(grouped):
     grouped['precipitation_intensity'] = np.where(
         grouped['hours_with_precip'] == 0,
         0.0,
         round(grouped['precip_total'] / grouped['hours_with_precip'], 2)
     )
+    return grouped
 
-    def normalize(series):
-        min_val, max_val = series.min(), series.max()
-        if max_val == min_val:
-            return pd.Series(0.0, index=series.index)
-        return round((series - min_val) / (max_val - min_val), 2)
 
-    grouped['norm_range'] = normalize(grouped['daily_temp_range'])
-    grouped['norm_intensity'] = normalize(grouped['precipitation_intensity'])
-    grouped['norm_wind'] = normalize(grouped['avg_wind_speed'])
+def add_severity_index(grouped, bounds=None):
+    # bounds maps each of NORMALIZED_COLUMNS to (min, max) when the rows are
+    # only part of the table, otherwise they are taken from the rows themselves
+    bounds = bounds or {}
+    grouped['norm_range'] = normalize(grouped['daily_temp_range'], bounds.get('daily_temp_range'))
+    grouped['norm_intensity'] = normalize(grouped['precipitation_intensity'], bounds.get('precipitation_intensity'))
+    grouped['norm_wind'] = normalize(grouped['avg_wind_speed'], bounds.get('avg_wind_speed'))
     grouped['regional_severity_index'] = round(
         0.3 * grouped['norm_range']
         + 0.3 * grouped['norm_intensity']
         + 0.4 * grouped['norm_wind'],
         2,
     )
+    return grouped
 
+
+def format_report(grouped):
     grouped = grouped.drop(
         [
             'precip_total',
@@ -167,6 +332,122 @@ def analyze_climate_data(climate_data):
     return result
 
 
-climate_data = ast.literal_eval(input().strip())
-result_df = analyze_climate_data(climate_data)
-print(result_df.to_string(float_format=lambda x: f'{x:.2f}'))
+def severity_report(grouped):
+    return format_report(add_severity_index(add_precipitation_intensity(grouped)))
+
+
+# stage name -> function of the previous stage's output, in pipeline order
+PIPELINE = [
+    ('readings', prepare_readings),
+    ('hourly', hourly_resample),
+    ('rolling', add_rolling_features),
+    ('anomaly', add_temperature_anomaly),
+    ('rollup', regional_rollup),
+    ('report', severity_report),
+]
+
+
+def analyze_climate_data(climate_data, budget=None, profiler=None, timestamp_format=None):
+    value = pd.DataFrame(climate_data)
+    for name, stage in PIPELINE:
+        if stage is prepare_readings and timestamp_format:
+            stage = functools.partial(prepare_readings, timestamp_format=timestamp_format)
+        value = stage(value) if profiler is None else profiler.run(name, stage, value)
+        if budget is not None:
+            budget.record(name, value)
+    if profiler is not None:
+        profiler.flush()
+    return value
+
+
+def _reject_combined(parser, args, option, flags):
+    conflicting = [flag for flag in flags if getattr(args, flag[2:].replace('-', '_'))]
+    if conflicting:
+        parser.error(f"{option} cannot be combined with {', '.join(conflicting)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Regional severity report for climate station readings.')
+    parser.add_argument('input', nargs='?', help='JSON Lines, CSV, Parquet, Arrow IPC or .npz file (default: a Python literal on stdin)')
+    parser.add_argument('--format', choices=['jsonl', 'csv', 'parquet', 'arrow', 'npz'], help='input format (default: from the file extension)')
+    parser.add_argument('--timestamp-format', metavar='FORMAT',
+                        help="strftime format of the timestamp strings, e.g. '%%Y-%%m-%%d %%H:%%M:%%S' (default: guessed from the first one)")
+    parser.add_argument('--chunksize', type=int, default=100_000, help='readings per chunk')
+    parser.add_argument('--lateness', help='close station-hours this long behind the newest reading, e.g. 2h')
+    parser.add_argument('--workers', type=int, help='process stations in this many worker processes')
+    parser.add_argument('--memory-budget', help='fail when a stage needs more than this, e.g. 4GB; prints per-stage memory')
+    parser.add_argument('--profile', action='append', metavar='SINK',
+                        help="per-stage timings to 'log', a .prom file (Prometheus text) or a JSON lines file; repeatable")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='also trace memory per stage with tracemalloc, in an extra run of each stage')
+    parser.add_argument('--spill-dir', help='process the input out of core, spilling station partitions under this directory')
+    parser.add_argument('--partitions', type=int, default=64, help='station partitions for --spill-dir')
+    parser.add_argument('--cache-dir', help='reuse results of unchanged station/day partitions cached under this directory')
+    parser.add_argument('--cache-size', default='1GB', help='evict the least recently used cache entries above this size')
+    parser.add_argument('--output', help='write the report to a .csv, .parquet or .arrow file instead of stdout')
+    parser.add_argument('--output-format', choices=['csv', 'parquet', 'arrow'], help='output format (default: from the extension)')
+    args = parser.parse_args(argv)
+    if args.cache_dir:
+        _reject_combined(parser, args, '--cache-dir', ['--workers', '--memory-budget', '--profile', '--spill-dir'])
+    if args.memory_budget:
+        # the worker processes run the stages, the budget would never see them
+        _reject_combined(parser, args, '--memory-budget', ['--workers'])
+    if args.profile:
+        # only the in-memory pipeline runs the stages one by one
+        _reject_combined(parser, args, '--profile', ['--workers', '--spill-dir'])
+    elif args.profile_memory:
+        parser.error('--profile-memory needs --profile')
+    if args.spill_dir:
+        if not args.input:
+            parser.error('--spill-dir needs an input file, stdin is read in memory')
+        _reject_combined(parser, args, '--spill-dir', ['--workers', '--lateness', '--memory-budget'])
+
+    if args.spill_dir:
+        from climate_outofcore import analyze_climate_out_of_core
+        from climate_stream import read_chunks
+
+        chunks = read_chunks(args.input, args.format, args.chunksize)
+        result_df = analyze_climate_out_of_core(chunks, args.spill_dir, args.partitions, args.timestamp_format)
+    elif args.input and not (args.workers or args.memory_budget or args.profile or args.cache_dir):
+        from climate_stream import analyze_climate_stream, read_chunks
+
+        chunks = read_chunks(args.input, args.format, args.chunksize)
+        result_df = analyze_climate_stream(chunks, lateness=args.lateness, timestamp_format=args.timestamp_format)
+    else:
+        # the per-stage options need the whole frame at once
+        if args.input:
+            from climate_stream import read_frame
+
+            climate_data = read_frame(args.input, args.format)
+        else:
+            climate_data = ast.literal_eval(input().strip())
+        if args.cache_dir:
+            from climate_cache import ResultCache, analyze_climate_cached
+
+            cache = ResultCache(args.cache_dir, args.cache_size)
+            result_df = analyze_climate_cached(climate_data, cache, args.timestamp_format)
+            print(cache.report().to_string(index=False), file=sys.stderr)
+        elif args.workers:
+            from climate_parallel import analyze_climate_parallel
+
+            result_df = analyze_climate_parallel(climate_data, args.workers, args.timestamp_format)
+        else:
+            budget = MemoryBudget(args.memory_budget) if args.memory_budget else None
+            profiler = None
+            if args.profile:
+                from climate_profile import StageProfiler, sink_for
+
+                logging.basicConfig(level=logging.INFO, format='%(message)s')
+                profiler = StageProfiler([sink_for(target) for target in args.profile], memory=args.profile_memory)
+            result_df = analyze_climate_data(climate_data, budget, profiler, args.timestamp_format)
+            if budget is not None:
+                print(budget.report().to_string(index=False), file=sys.stderr)
+    if args.output:
+        from climate_stream import write_result
+
+        write_result(result_df, args.output, args.output_format)
+    else:
+        print(result_df.to_string(float_format=lambda x: f'{x:.2f}'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from analyze_climate_corrected import (
+    add_temperature_anomaly,
+    compute_derived_metrics,
+    hourly_resample,
+    parse_timestamps,
+    regional_rollup,
+    severity_report,
+)
+from climate_rolling import add_rolling_features
+from climate_schema import apply_schema
+
+DIRECTIONS = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+
+
+def synthetic_readings(stations=20, regions=4, days=7, freq='10min', seed=0):
+    # records with the analyze_climate_data input schema: every station reports
+    # every freq with a little jitter, weather follows a daily cycle plus noise
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2024-01-01')
+    times = pd.date_range(start, start + pd.Timedelta(days=days), freq=freq, inclusive='left')
+    n = len(times) * stations
+    station = np.repeat(np.arange(stations), len(times))
+    jitter = rng.integers(0, pd.Timedelta(freq).total_seconds(), n)
+    timestamps = np.tile(times.values, stations) + jitter.astype('timedelta64[s]')
+    hour = pd.DatetimeIndex(timestamps).hour.to_numpy()
+    cycle = np.sin((hour - 9) / 24 * 2 * np.pi)
+    base = rng.normal(12, 6, stations)[station]
+    rain = rng.random(n) < 0.15
+    df = pd.DataFrame({
+        'timestamp': pd.DatetimeIndex(timestamps).strftime('%Y-%m-%d %H:%M:%S'),
+        'station_id': np.char.add('ST', np.char.zfill(station.astype(str), 4)),
+        'region': np.char.add('Region-', (station % regions).astype(str)),
+        'elevation': rng.uniform(0, 1500, stations).round(1)[station],
+        'temperature': (base + 8 * cycle + rng.normal(0, 2, n)).round(1),
+        'humidity': np.clip(65 - 20 * cycle + rng.normal(0, 10, n), 5, 100).round(1),
+        'pressure': (1013 + rng.normal(0, 6, n)).round(1),
+        'precipitation': np.where(rain, rng.exponential(4, n), 0.0).round(1),
+        'wind_speed': rng.gamma(2, 4, n).round(1),
+        'wind_direction': np.asarray(DIRECTIONS)[rng.integers(0, len(DIRECTIONS), n)],
+    })
+    return df.sample(frac=1, random_state=seed).to_dict('records')
+
+
+# stage name -> function of the previous stage's output, in pipeline order
+STAGES = [
+    ('load', pd.DataFrame),
+    ('parse_timestamps', parse_timestamps),
+    ('derived_metrics', lambda df: apply_schema(compute_derived_metrics(df))),
+    ('hourly_resample', hourly_resample),
+    ('rolling_features', add_rolling_features),
+    ('station_stats', add_temperature_anomaly),
+    ('regional_rollup', regional_rollup),
+    ('normalization', severity_report),
+]
+
+
+def run_once(records):
+    # wall time per stage, without tracemalloc, which slows pandas-heavy stages
+    # down unevenly (up to ~10x)
+    timings = {}
+    value = records
+    for name, stage in STAGES:
+        started = time.perf_counter()
+        value = stage(value)
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def peak_memory(records):
+    # peak traced allocation per stage, in a separate pass so it does not skew the timings
+    peaks = {}
+    value = records
+    for name, stage in STAGES:
+        tracemalloc.start()
+        value = stage(value)
+        peaks[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peaks
+
+
+def run_benchmark(stations=20, regions=4, days=7, freq='10min', repeat=3, seed=0):
+    records = synthetic_readings(stations, regions, days, freq, seed)
+    runs = [run_once(records) for _ in range(repeat)]
+    peaks = peak_memory(records)
+    stages = {}
+    for name, _ in STAGES:
+        seconds = [timings[name] for timings in runs]
+        best = min(seconds)
+        stages[name] = {
+            'seconds_min': best,
+            'seconds_median': statistics.median(seconds),
+            'readings_per_second': len(records) / best if best else None,
+            'peak_bytes': peaks[name],
+        }
+    total = [sum(timings.values()) for timings in runs]
+    return {
+        'params': {'stations': stations, 'regions': regions, 'days': days, 'freq': freq, 'repeat': repeat, 'seed': seed},
+        'readings': len(records),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+        },
+        'stages': stages,
+        'total': {
+            'seconds_min': min(total),
+            'seconds_median': statistics.median(total),
+            'readings_per_second': len(records) / min(total),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time every stage of analyze_climate_data on synthetic readings.')
+    parser.add_argument('--stations', type=int, default=20)
+    parser.add_argument('--regions', type=int, default=4)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--freq', default='10min', help='reading interval per station')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.stations, args.regions, args.days, args.freq, args.repeat, args.seed)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
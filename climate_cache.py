@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from analyze_climate_corrected import (
+    compute_derived_metrics,
+    hourly_agg_dict,
+    parse_timestamps,
+    severity_report,
+)
+from climate_rollup import RegionDayRollup
+from climate_schema import apply_schema, parse_size
+from climate_stream import HourlyPartials
+
+# bump when the pipeline changes what a partition computes to, old entries then miss
+CACHE_VERSION = '2'
+
+# column holding the cache key of every cached row
+KEY_COLUMN = '_cache_key'
+
+
+class ResultCache:
+    # cached rows live in Parquet segments under directory, each written in one
+    # go and holding the rows of many keys; manifest.json maps every key to its
+    # segment. A hit touches the segment so the modification times order the
+    # segments by last use and the oldest go first over max_bytes.
+    def __init__(self, directory, max_bytes='1GB'):
+        self.directory = directory
+        self.max_bytes = parse_size(max_bytes)
+        self.hits = {}
+        self.misses = {}
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        try:
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def _path(self, segment):
+        return os.path.join(self.directory, segment)
+
+    def get_many(self, kind, keys):
+        # rows of the cached keys, read from their segments in one dataset scan,
+        # with the key in KEY_COLUMN; None when none of the keys is cached
+        import pyarrow.dataset as ds
+
+        wanted = {}
+        for key in keys:
+            segment = self.manifest.get(key)
+            if segment is not None and os.path.exists(self._path(segment)):
+                wanted.setdefault(segment, []).append(key)
+        found = [key for segment_keys in wanted.values() for key in segment_keys]
+        self.hits[kind] = self.hits.get(kind, 0) + len(found)
+        self.misses[kind] = self.misses.get(kind, 0) + len(keys) - len(found)
+        if not found:
+            return None
+        paths = [self._path(segment) for segment in wanted]
+        table = ds.dataset(paths, format='parquet').to_table(filter=ds.field(KEY_COLUMN).isin(found))
+        for path in paths:
+            os.utime(path)
+        return table.to_pandas()
+
+    def put_many(self, kind, frame, groups=None):
+        # frame carries its keys in KEY_COLUMN; one segment per value of groups
+        # (e.g. per date), or a single segment
+        parts = [frame] if groups is None else [part for _, part in frame.groupby(groups, sort=False)]
+        for part in parts:
+            segment = f'{kind}-{uuid.uuid4().hex}.parquet'
+            tmp = self._path(segment + '.tmp')
+            part.to_parquet(tmp)
+            os.replace(tmp, self._path(segment))
+            self.manifest.update(dict.fromkeys(part[KEY_COLUMN].unique().tolist(), segment))
+        self._write_manifest()
+
+    def _write_manifest(self):
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.parquet'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.name))
+        total = sum(size for _, size, _ in entries)
+        removed = set()
+        for _, size, segment in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(self._path(segment))
+            removed.add(segment)
+            total -= size
+        if removed:
+            self.manifest = {key: segment for key, segment in self.manifest.items() if segment not in removed}
+            self._write_manifest()
+
+    def report(self):
+        kinds = sorted(set(self.hits) | set(self.misses))
+        return pd.DataFrame({
+            'kind': kinds,
+            'hits': [self.hits.get(kind, 0) for kind in kinds],
+            'misses': [self.misses.get(kind, 0) for kind in kinds],
+        })
+
+
+def _key(*parts):
+    return hashlib.sha1('|'.join(map(str, (CACHE_VERSION,) + parts)).encode()).hexdigest()
+
+
+def _group_hashes(codes, hashes):
+    # order-independent digest of the hashes in every group: two wrapping sums
+    # of differently mixed hashes plus the count; groups are returned in order
+    # of their first row's position in the sort, with that row's index
+    order = np.argsort(codes, kind='stable')
+    starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]])
+    first = np.add.reduceat(hashes[order], starts)
+    second = np.add.reduceat(pd.util.hash_array(hashes)[order], starts)
+    counts = np.diff(np.r_[starts, len(hashes)])
+    return order[starts], first, second, counts
+
+
+def partition_keys(df):
+    # content key per (station_id, date) of the readings, indexed by the pair, and
+    # the partition number of every row; rows are hashed one by one and summed
+    # per partition, so the key does not depend on the row order
+    stations = np.asarray(df['station_id'], dtype=object)
+    station_codes, _ = pd.factorize(stations)
+    day_codes, days = pd.factorize(df.index.normalize())
+    codes, _ = pd.factorize(station_codes.astype(np.int64) * len(days) + day_codes)
+    rows = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    heads, first, second, counts = _group_hashes(codes, rows)
+    dates = np.empty(len(df), dtype=object)
+    dates[heads] = days[day_codes[heads]].date
+    keys = [
+        _key('hourly', stations[head], dates[head], first[i], second[i], counts[i])
+        for i, head in enumerate(heads)
+    ]
+    index = pd.MultiIndex.from_arrays([stations[heads], dates[heads]], names=['station_id', 'date'])
+    return pd.Series(keys, index=index), codes[heads], codes
+
+
+def _station_dates(hourly):
+    return pd.MultiIndex.from_arrays([
+        np.asarray(hourly.index.get_level_values('station_id'), dtype=object),
+        hourly.index.get_level_values('timestamp').date,
+    ])
+
+
+def region_day_keys(hourly):
+    # key of every hourly row's region/day, built from the set of partition keys
+    # it is made of, and the (region, date) of every key
+    regions = np.asarray(hourly['region'], dtype=object)
+    dates = hourly.index.get_level_values('timestamp').date
+    codes = pd.Series(regions).groupby([regions, dates], sort=False).ngroup().to_numpy()
+    owners = pd.DataFrame({'code': codes, 'owner': hourly[KEY_COLUMN].to_numpy()}).drop_duplicates()
+    owner_hashes = pd.util.hash_array(owners['owner'].to_numpy(dtype=object))
+    owner_codes = owners['code'].to_numpy()
+    heads, first, second, counts = _group_hashes(owner_codes, owner_hashes)
+    heads = owners.index.to_numpy()[heads]
+    keys = np.empty(codes.max() + 1 if len(codes) else 0, dtype=object)
+    keys[codes[heads]] = [
+        _key('region_day', regions[head], dates[head], first[i], second[i], counts[i])
+        for i, head in enumerate(heads)
+    ]
+    return keys[codes]
+
+
+def analyze_climate_cached(climate_data, cache, timestamp_format=None):
+    # station/day partitions whose readings are unchanged reuse their cached
+    # hourly rows, region/day rows built only from unchanged partitions are
+    # reused too; the normalization always runs over the whole table
+    agg_dict = hourly_agg_dict()
+    df = climate_data.copy() if isinstance(climate_data, pd.DataFrame) else pd.DataFrame(climate_data)
+    df = parse_timestamps(df[df['station_id'].notna()], timestamp_format)
+    keys, groups, codes = partition_keys(df)
+
+    parts = []
+    cached = cache.get_many('hourly', keys.tolist())
+    if cached is not None:
+        parts.append(cached)
+    cached_keys = set() if cached is None else set(cached[KEY_COLUMN].unique())
+    missed = [group for group, key in zip(groups, keys) if key not in cached_keys]
+    if missed:
+        fresh = apply_schema(compute_derived_metrics(df[np.isin(codes, missed)]))
+        fresh = HourlyPartials.from_readings(fresh, agg_dict).finalize(agg_dict)
+        fresh[KEY_COLUMN] = keys.reindex(_station_dates(fresh)).to_numpy()
+        cache.put_many('hourly', fresh, fresh.index.get_level_values('timestamp').date)
+        parts.append(fresh)
+
+    # partitions in the order of their first reading, as the pipeline sees them
+    hourly = pd.concat(parts) if len(parts) > 1 else parts[0]
+    rank = pd.Series(np.arange(len(keys)), index=keys.to_numpy())
+    hourly = hourly.iloc[np.argsort(rank.reindex(hourly[KEY_COLUMN]).to_numpy(), kind='stable')]
+
+    row_keys = region_day_keys(hourly)
+    wanted = pd.unique(row_keys).tolist()
+    rows = []
+    cached = cache.get_many('region_day', wanted)
+    if cached is not None:
+        rows.append(cached)
+    cached_keys = set() if cached is None else set(cached[KEY_COLUMN].unique())
+    stale = ~pd.Series(row_keys).isin(cached_keys).to_numpy()
+    if stale.any():
+        stale_hourly = hourly[stale]
+        fresh = RegionDayRollup.from_hourly(stale_hourly).finalize()
+        owners = pd.Series(row_keys[stale], index=pd.MultiIndex.from_arrays([
+            np.asarray(stale_hourly['region'], dtype=object),
+            stale_hourly.index.get_level_values('timestamp').date,
+        ]))
+        owners = owners[~owners.index.duplicated()]
+        fresh[KEY_COLUMN] = owners.reindex(pd.MultiIndex.from_frame(fresh[['region', 'date']])).to_numpy()
+        cache.put_many('region_day', fresh)
+        rows.append(fresh)
+    cache.evict()
+
+    grouped = pd.concat(rows).drop(columns=KEY_COLUMN)
+    grouped = grouped.sort_values(['region', 'date'], kind='stable').reset_index(drop=True)
+    return severity_report(grouped)
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from analyze_climate_corrected import (
+    NORMALIZED_COLUMNS,
+    add_precipitation_intensity,
+    add_severity_index,
+    format_report,
+    hourly_agg_dict,
+    prepare_readings,
+)
+from climate_rollup import RegionDayRollup
+from climate_stats import WelfordStats
+from climate_stream import HourlyPartials
+
+
+def _same_bounds(a, b):
+    if a is None or b is None:
+        return False
+    return all(np.array_equal(a[col], b[col], equal_nan=True) for col in NORMALIZED_COLUMNS)
+
+
+class IncrementalAnalyzer:
+    # state is kept per date: hourly partials, finalized hourly rows and the
+    # region rows of that date. New readings only re-aggregate the dates they
+    # touch. normalize() needs the min/max over every region/day row, so each
+    # date keeps its own extent and the whole table is rescaled only when the
+    # global bounds actually move; otherwise just the touched rows are scored.
+    # timestamp_format is declared once for the feed instead of being guessed
+    # again on every batch.
+    def __init__(self, agg_dict=None, timestamp_format=None):
+        self.agg_dict = agg_dict or hourly_agg_dict()
+        self.timestamp_format = timestamp_format
+        self.partials = {}
+        self.hourly = {}
+        self.days = {}
+        self.extents = {}
+        self.station_stats = WelfordStats()
+        self.table = None
+        self.bounds = None
+
+    def update(self, readings):
+        df = readings.copy() if isinstance(readings, pd.DataFrame) else pd.DataFrame(readings)
+        if df.empty:
+            return self.report()
+        df = prepare_readings(df, self.timestamp_format)
+        delta = HourlyPartials.from_readings(df, self.agg_dict)
+        dates = delta.stats.index.get_level_values('timestamp').date
+        changed = list(pd.unique(dates))
+        for day in changed:
+            part = delta.select(dates == day)
+            if day in self.partials:
+                part = HourlyPartials.merge([self.partials[day], part], self.agg_dict)
+            self.partials[day] = part
+            self._replace_day(day, part.finalize(self.agg_dict))
+
+        bounds = {}
+        for col in NORMALIZED_COLUMNS:
+            lows = pd.Series([extent[col][0] for extent in self.extents.values()])
+            highs = pd.Series([extent[col][1] for extent in self.extents.values()])
+            bounds[col] = (lows.min(), highs.max())
+        if _same_bounds(bounds, self.bounds):
+            rows = add_severity_index(pd.concat([self.days[day] for day in changed]), bounds)
+            kept = self.table[~self.table['date'].isin(changed)]
+            self.table = pd.concat([kept, rows], ignore_index=True)
+        else:
+            self.table = add_severity_index(pd.concat(self.days.values(), ignore_index=True), bounds)
+        self.bounds = bounds
+        return self.report()
+
+    def _replace_day(self, day, hourly):
+        old = self.hourly.get(day)
+        if old is not None:
+            self.station_stats = self.station_stats.subtract(
+                WelfordStats.from_values(old.index.get_level_values('station_id'), old['temperature'])
+            )
+        self.station_stats = self.station_stats.merge(
+            WelfordStats.from_values(hourly.index.get_level_values('station_id'), hourly['temperature'])
+        )
+        self.hourly[day] = hourly
+        rows = add_precipitation_intensity(RegionDayRollup.from_hourly(hourly).finalize())
+        self.days[day] = rows
+        self.extents[day] = {col: (rows[col].min(), rows[col].max()) for col in NORMALIZED_COLUMNS}
+
+    def report(self):
+        if self.table is None:
+            return None
+        return format_report(self.table.sort_values(['region', 'date'], kind='stable'))
+
+    def hourly_frame(self):
+        # station-hours with readings, flagged against the running station statistics
+        hourly = pd.concat([self.hourly[day] for day in sorted(self.hourly)])
+        mean, std = self.station_stats.broadcast(hourly.index.get_level_values('station_id'))
+        std = np.where(std == 0, 1e-6, std)
+        hourly['temperature_anomaly'] = np.abs(hourly['temperature'].to_numpy() - mean) > 2 * std
+        return hourly
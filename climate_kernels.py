@@ -0,0 +1,153 @@
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# 'numba' runs the fused loops below compiled, 'numpy' keeps the vectorized
+# code paths; CLIMATE_KERNELS=numpy forces the fallback even with numba installed
+BACKEND = 'numba' if numba is not None else 'numpy'
+
+
+def use_backend(name):
+    global BACKEND
+    if name not in ('numba', 'numpy'):
+        raise ValueError(f'unknown kernel backend: {name}')
+    if name == 'numba' and numba is None:
+        raise ValueError('the numba backend needs numba installed')
+    BACKEND = name
+
+
+# validated like use_backend(), a typo or a missing numba fails at import
+# instead of quietly running another backend
+if os.environ.get('CLIMATE_KERNELS'):
+    use_backend(os.environ['CLIMATE_KERNELS'])
+
+
+def compiled():
+    return BACKEND == 'numba'
+
+
+def _jit(func):
+    # compiled once and cached next to this module, plain Python without numba
+    return numba.njit(cache=True, nogil=True)(func) if numba is not None else func
+
+
+@_jit
+def _group_sum_mean_max(codes, n_groups, values):
+    # per-group Kahan sum, count and max of the non-NaN values in row order,
+    # the same compensation pandas' groupby sum/mean use
+    total = np.zeros(n_groups)
+    compensation = np.zeros(n_groups)
+    count = np.zeros(n_groups, dtype=np.int64)
+    high = np.full(n_groups, np.nan)
+    for i in range(len(codes)):
+        group = codes[i]
+        value = values[i]
+        if group < 0 or value != value:
+            continue
+        count[group] += 1
+        y = value - compensation[group]
+        t = total[group] + y
+        compensation[group] = t - total[group] - y
+        if compensation[group] != compensation[group]:
+            compensation[group] = 0.0
+        total[group] = t
+        if not value <= high[group]:
+            high[group] = value
+    return total, count, high
+
+
+def group_aggregate(codes, n_groups, values, agg):
+    # 'sum', 'mean' or 'max' of float64 values per group code, -1 codes are skipped
+    total, count, high = _group_sum_mean_max(np.asarray(codes, dtype=np.int64), n_groups, values)
+    if agg == 'sum':
+        return total
+    if agg == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
+    return high
+
+
+@_jit
+def _mode_codes(codes, n_groups, value_codes, k):
+    # index of the most frequent value code per group, the smallest on ties,
+    # -1 for groups without a counted value
+    counts = np.zeros((n_groups, k), dtype=np.int64)
+    for i in range(len(codes)):
+        if codes[i] >= 0 and value_codes[i] >= 0:
+            counts[codes[i], value_codes[i]] += 1
+    best = np.full(n_groups, -1, dtype=np.int64)
+    for group in range(n_groups):
+        top = 0
+        for value in range(k):
+            if counts[group, value] > top:
+                top = counts[group, value]
+                best[group] = value
+    return best
+
+
+def mode_codes(codes, n_groups, value_codes, k):
+    return _mode_codes(np.asarray(codes, dtype=np.int64), n_groups, np.asarray(value_codes, dtype=np.int64), k)
+
+
+@_jit
+def _window_change(starts, x, window, rate):
+    # x is sorted by group with groups beginning at starts; last - first over
+    # the trailing window (divided by its length - 1 for rates), 0 for a single
+    # row and NaN when the window has no observation
+    n = len(x)
+    change = np.empty(n)
+    group_end = np.empty(len(starts), dtype=np.int64)
+    group_end[:-1] = starts[1:]
+    if len(starts):
+        group_end[-1] = n
+    for g in range(len(starts)):
+        last_seen = -1
+        for row in range(starts[g], group_end[g]):
+            if x[row] == x[row]:
+                last_seen = row
+            lag = min(row - starts[g], window - 1)
+            first = row - lag
+            if last_seen < first:
+                change[row] = np.nan
+            elif lag == 0:
+                change[row] = 0.0
+            else:
+                value = x[row] - x[first]
+                change[row] = value / lag if rate else value
+    return change
+
+
+def window_change_sorted(starts, x, window, rate):
+    return _window_change(np.asarray(starts, dtype=np.int64), np.asarray(x, dtype=float), window, rate)
+
+
+def check_parity(records):
+    # runs the pipeline with both backends and checks every hourly column and
+    # the report agree exactly; see test_climate_kernels.py
+    import pandas as pd
+
+    from analyze_climate_corrected import (
+        add_temperature_anomaly,
+        hourly_resample,
+        prepare_readings,
+        regional_rollup,
+        severity_report,
+    )
+    from climate_rolling import add_rolling_features
+
+    backend = BACKEND
+    results = {}
+    try:
+        for name in ('numpy', 'numba'):
+            use_backend(name)
+            hourly = add_temperature_anomaly(add_rolling_features(hourly_resample(prepare_readings(pd.DataFrame(records)))))
+            results[name] = (hourly, severity_report(regional_rollup(hourly.copy())))
+    finally:
+        use_backend(backend)
+    pd.testing.assert_frame_equal(results['numpy'][0], results['numba'][0])
+    pd.testing.assert_frame_equal(results['numpy'][1], results['numba'][1])
@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from analyze_climate_corrected import guess_timestamp_format, prepare_readings, severity_report
+from climate_parallel import station_stages
+from climate_rollup import RegionDayRollup
+from climate_schema import apply_schema
+
+PARTITIONS = 64
+
+
+def station_partition(station_ids, partitions):
+    # stable across chunks and runs, every reading of a station lands in one partition
+    hashes = pd.util.hash_array(np.asarray(station_ids, dtype=object).astype(str))
+    return (hashes % np.uint64(partitions)).astype(np.int64)
+
+
+class OutOfCoreAnalyzer:
+    # three passes over disk: readings are prepared chunk by chunk and spilled
+    # into station partitions, each partition runs the per-station stages and
+    # spills its hourly frame, the hourly partials are then folded into the
+    # region/day rollup one at a time. Partitions hold whole stations because
+    # rolling windows and station statistics need a station's full history.
+    def __init__(self, spill_dir, partitions=PARTITIONS, timestamp_format=None):
+        self.spill_dir = spill_dir
+        self.partitions = partitions
+        self.chunks = 0
+        self.spilled = {}
+        self.timestamp_format = timestamp_format
+
+    def _path(self, stage, partition, chunk=None):
+        name = f'part-{partition:05d}' if chunk is None else f'part-{partition:05d}-{chunk}'
+        return os.path.join(self.spill_dir, stage, name + '.parquet')
+
+    def add_chunk(self, chunk):
+        chunk = chunk[chunk['station_id'].notna()]
+        if chunk.empty:
+            return
+        if self.timestamp_format is None:
+            self.timestamp_format = guess_timestamp_format(np.asarray(chunk['timestamp'], dtype=object))
+        df = prepare_readings(chunk, self.timestamp_format)
+        owners = station_partition(df['station_id'], self.partitions)
+        os.makedirs(os.path.join(self.spill_dir, 'readings'), exist_ok=True)
+        for partition in np.unique(owners):
+            path = self._path('readings', partition, self.chunks)
+            df[owners == partition].to_parquet(path)
+            self.spilled.setdefault(partition, []).append(path)
+        self.chunks += 1
+
+    def _readings(self, partition):
+        paths = self.spilled.get(partition)
+        if not paths:
+            return None
+        # categories differ between chunks, so they are rebuilt after the concat
+        df = pd.concat([pd.read_parquet(path) for path in paths])
+        return apply_schema(df.astype({col: object for col in df.select_dtypes('category')}).sort_index())
+
+    def result(self):
+        os.makedirs(os.path.join(self.spill_dir, 'hourly'), exist_ok=True)
+        hourly_paths = []
+        for partition in range(self.partitions):
+            df = self._readings(partition)
+            if df is None:
+                continue
+            hourly_paths.append(self._path('hourly', partition))
+            station_stages(df).to_parquet(hourly_paths[-1])
+        rollup = RegionDayRollup()
+        for path in hourly_paths:
+            rollup = rollup.merge(RegionDayRollup.from_hourly(pd.read_parquet(path)))
+        return severity_report(rollup.finalize())
+
+
+def analyze_climate_out_of_core(chunks, spill_dir=None, partitions=PARTITIONS, timestamp_format=None):
+    if spill_dir is not None:
+        os.makedirs(spill_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=spill_dir) as tmp:
+        analyzer = OutOfCoreAnalyzer(tmp, partitions, timestamp_format)
+        for chunk in chunks:
+            analyzer.add_chunk(chunk)
+        return analyzer.result()
@@ -0,0 +1,59 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analyze_climate_corrected import (
+    add_temperature_anomaly,
+    hourly_resample,
+    prepare_readings,
+    severity_report,
+)
+from climate_rollup import RegionDayRollup
+from climate_rolling import add_rolling_features
+
+
+def partition_stations(station_ids, n_parts):
+    # row positions per partition; whole stations go to the partition with the
+    # fewest rows so far (largest stations first) so every per-station stage
+    # sees all of a station's readings and the partitions stay balanced
+    codes, _ = pd.factorize(np.asarray(station_ids, dtype=object))
+    sizes = np.bincount(codes[codes >= 0])
+    load = np.zeros(n_parts, dtype=np.int64)
+    owner = np.empty(len(sizes), dtype=np.int64)
+    for station in np.argsort(-sizes, kind='stable'):
+        owner[station] = load.argmin()
+        load[owner[station]] += sizes[station]
+    valid = codes >= 0
+    rows = np.flatnonzero(valid)
+    parts = owner[codes[valid]]
+    return [rows[parts == part] for part in range(n_parts) if load[part]]
+
+
+def station_stages(df):
+    # the per-station stages on prepared readings of whole stations
+    hourly_df = hourly_resample(df)
+    hourly_df = add_rolling_features(hourly_df)
+    return add_temperature_anomaly(hourly_df)
+
+
+def station_rollup(df, timestamp_format=None):
+    # everything before normalize() for a set of whole stations
+    return RegionDayRollup.from_hourly(station_stages(prepare_readings(df, timestamp_format)))
+
+
+def analyze_climate_parallel(climate_data, workers=None, timestamp_format=None):
+    df = climate_data.copy() if isinstance(climate_data, pd.DataFrame) else pd.DataFrame(climate_data)
+    workers = workers or os.cpu_count() or 1
+    parts = [df.iloc[rows].reset_index(drop=True) for rows in partition_stations(df['station_id'], workers)]
+    if len(parts) <= 1:
+        rollups = [station_rollup(part, timestamp_format) for part in parts]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(parts))) as pool:
+            rollups = list(pool.map(station_rollup, parts, itertools.repeat(timestamp_format)))
+    rollup = RegionDayRollup()
+    for part in rollups:
+        rollup = rollup.merge(part)
+    return severity_report(rollup.finalize())
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+
+class LoggingSink:
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('climate')
+        self.level = level
+
+    def emit(self, record):
+        if record['memory_peak'] is None:
+            self.logger.log(
+                self.level,
+                'stage %s: %.4fs, rows %s -> %s',
+                record['stage'], record['seconds'], record['rows_in'], record['rows_out'],
+            )
+            return
+        self.logger.log(
+            self.level,
+            'stage %s: %.4fs, rows %s -> %s, memory %+d bytes (peak %d)',
+            record['stage'], record['seconds'], record['rows_in'], record['rows_out'],
+            record['memory_delta'], record['memory_peak'],
+        )
+
+    def flush(self):
+        pass
+
+
+class JsonSink:
+    # one JSON object per stage, appended so runs accumulate in the same file
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        with open(self.path, 'a') as f:
+            for record in self.records:
+                f.write(json.dumps(record) + '\n')
+        self.records = []
+
+
+class PrometheusSink:
+    # text exposition format for the node exporter textfile collector; the file
+    # is replaced atomically with the stages of the latest run
+    METRICS = {
+        'seconds': ('climate_stage_seconds', 'Wall time of the pipeline stage.'),
+        'rows_in': ('climate_stage_rows_in', 'Rows handed to the pipeline stage.'),
+        'rows_out': ('climate_stage_rows_out', 'Rows returned by the pipeline stage.'),
+        'memory_delta': ('climate_stage_memory_delta_bytes', 'Traced memory still allocated after the stage.'),
+        'memory_peak': ('climate_stage_memory_peak_bytes', 'Peak traced memory during the stage.'),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        lines = []
+        for key, (name, help_text) in self.METRICS.items():
+            if all(record[key] is None for record in self.records):
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for record in self.records:
+                lines.append(f'{name}{{stage="{record["stage"]}"}} {record[key]}')
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
+        self.records = []
+
+
+def sink_for(target):
+    # 'log', a .prom file for Prometheus or any other path for JSON lines
+    if target == 'log':
+        return LoggingSink()
+    if target.endswith('.prom'):
+        return PrometheusSink(target)
+    return JsonSink(target)
+
+
+def _rows(value):
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+class StageProfiler:
+    # runs pipeline stages and hands wall time, row counts and, with memory=True,
+    # traced memory to the sinks; pipelines only call it when a profiler is passed
+    # in. tracemalloc slows pandas-heavy stages down unevenly (up to ~10x), so a
+    # stage traced for memory is run once more untraced for its wall time.
+    def __init__(self, sinks, memory=False):
+        self.sinks = list(sinks)
+        self.memory = memory
+
+    def run(self, stage, func, value):
+        rows_in = _rows(value)
+        delta = peak = None
+        if self.memory:
+            delta, peak = self._trace(func, value)
+        started = time.perf_counter()
+        result = func(value)
+        seconds = time.perf_counter() - started
+        record = {
+            'stage': stage,
+            'seconds': seconds,
+            'rows_in': rows_in,
+            'rows_out': _rows(result),
+            'memory_delta': delta,
+            'memory_peak': peak,
+        }
+        for sink in self.sinks:
+            sink.emit(record)
+        return result
+
+    def _trace(self, func, value):
+        # memory still allocated after the stage and its peak, from a run on a
+        # copy of the input since stages may modify it in place
+        value = value.copy() if hasattr(value, 'copy') else value
+        tracing = not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = func(value)
+        current, peak = tracemalloc.get_traced_memory()
+        del result
+        if tracing:
+            tracemalloc.stop()
+        return current - before, peak - before
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
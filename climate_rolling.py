@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+import climate_kernels
+
+
+# name -> (source column, window length in rows, 'diff' or 'rate'); hourly frames
+# have a row for every hour of a station so a window of 3 rows is 3 hours
+ROLLING_FEATURES = {
+    'temperature_trend': ('temperature', 3, 'diff'),
+    'pressure_change_rate': ('pressure', 3, 'rate'),
+}
+
+
+def window_change(codes, values, window, kind='diff'):
+    # same as groupby(codes).rolling(window, min_periods=1) applying
+    # last - first (or divided by the window length - 1): windows only depend
+    # on their endpoints, so no function runs per window
+    codes = np.asarray(codes)
+    n = len(codes)
+    order = np.argsort(codes, kind='stable')
+    x = np.asarray(values, dtype=float)[order]
+    c = codes[order]
+    starts = np.flatnonzero(np.r_[True, c[1:] != c[:-1]]) if n else np.array([], dtype=np.int64)
+    if climate_kernels.compiled():
+        result = np.empty(n)
+        result[order] = climate_kernels.window_change_sorted(starts, x, window, kind == 'rate')
+        return result
+    sizes = np.diff(np.r_[starts, n])
+    positions = np.arange(n) - np.repeat(starts, sizes)
+    lag = np.minimum(positions, window - 1)
+    rows = np.arange(n)
+    change = x - x[rows - lag]
+    if kind == 'rate':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change = change / lag
+    change[lag == 0] = 0.0
+    observed = np.r_[0, np.cumsum(~np.isnan(x))]
+    change[observed[rows + 1] - observed[rows - lag] == 0] = np.nan
+    result = np.empty(n)
+    result[order] = change
+    return result
+
+
+def add_rolling_features(hourly_df, features=None, by='station_id'):
+    features = ROLLING_FEATURES if features is None else features
+    codes, _ = pd.factorize(hourly_df[by])
+    for name, (column, window, kind) in features.items():
+        hourly_df[name] = window_change(codes, hourly_df[column], window, kind)
+    return hourly_df
@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def mode_from_counts(counts, index):
+    # counts holds occurrences indexed by the levels of index plus the value as
+    # the last level; same tie-breaking as grouped_mode, NaN where nothing counted
+    result = np.full(len(index), np.nan, dtype=object)
+    if len(counts) == 0:
+        return result
+    positions = index.get_indexer(counts.index.droplevel(-1))
+    value_codes, uniques = pd.factorize(counts.index.get_level_values(-1), sort=True)
+    order = np.lexsort((value_codes, -counts.to_numpy(), positions))
+    ordered = positions[order]
+    first = order[np.r_[True, ordered[1:] != ordered[:-1]]]
+    result[positions[first]] = np.asarray(uniques, dtype=object)[value_codes[first]]
+    return result
+
+
+def exact_sums(keys, values):
+    # correctly rounded per-group sums of the non-null values, kept as a (hi, lo)
+    # pair so that merging partial sums later gives the same total no matter how
+    # the rows were split between partials
+    values = pd.Series(np.asarray(values, dtype=float)).dropna()
+    keys = [np.asarray(key)[values.index] for key in keys]
+    groups = values.groupby(keys, sort=True).indices
+    hi = {}
+    lo = {}
+    for key, rows in groups.items():
+        part = values.to_numpy()[rows]
+        hi[key] = math.fsum(part)
+        lo[key] = math.fsum(np.append(part, -hi[key]))
+    return pd.Series(hi, dtype=float), pd.Series(lo, dtype=float)
+
+
+SUM_COLUMNS = ('precip', 'wind')
+
+
+class RegionDayRollup:
+    # mergeable per (region, date) state behind the regional_rollup columns
+    def __init__(self, stats=None, directions=None):
+        self.stats = stats
+        self.directions = directions
+
+    @classmethod
+    def from_hourly(cls, hourly):
+        keys = [hourly['region'].to_numpy(), hourly.index.get_level_values('timestamp').date]
+        grouped = hourly.groupby(keys)
+        precip_hi, precip_lo = exact_sums(keys, hourly['precipitation'])
+        wind_hi, wind_lo = exact_sums(keys, hourly['wind_speed'])
+        stats = pd.DataFrame({
+            'temp_max': grouped['temperature'].max(),
+            'temp_min': grouped['temperature'].min(),
+            'precip_hi': precip_hi,
+            'precip_lo': precip_lo,
+            'hours_with_precip': (hourly['precipitation'] > 0).groupby(keys).sum(),
+            'wind_hi': wind_hi,
+            'wind_lo': wind_lo,
+            'wind_count': grouped['wind_speed'].count(),
+        }).rename_axis(['region', 'date'])
+        for col in SUM_COLUMNS:
+            stats[[col + '_hi', col + '_lo']] = stats[[col + '_hi', col + '_lo']].fillna(0.0)
+        directions = hourly.groupby(keys + [hourly['wind_direction'].to_numpy()]).size()
+        directions = directions.rename_axis(['region', 'date', 'wind_direction'])
+        return cls(stats, directions)
+
+    def merge(self, other):
+        if self.stats is None:
+            return other
+        if other.stats is None:
+            return self
+        both = pd.concat([self.stats, other.stats])
+        stats = both.groupby(level=[0, 1]).agg({
+            'temp_max': 'max',
+            'temp_min': 'min',
+            'hours_with_precip': 'sum',
+            'wind_count': 'sum',
+        })
+        keys = [both.index.get_level_values(0), both.index.get_level_values(1)]
+        for col in SUM_COLUMNS:
+            parts = np.concatenate([both[col + '_hi'].to_numpy(), both[col + '_lo'].to_numpy()])
+            hi, lo = exact_sums([np.tile(key, 2) for key in keys], parts)
+            stats[col + '_hi'] = hi.reindex(stats.index)
+            stats[col + '_lo'] = lo.reindex(stats.index)
+        directions = pd.concat([self.directions, other.directions]).groupby(level=[0, 1, 2]).sum()
+        return RegionDayRollup(stats, directions)
+
+    def finalize(self):
+        # same frame as regional_rollup(hourly_df)
+        stats = self.stats.sort_index()
+        wind_count = stats['wind_count'].where(stats['wind_count'] > 0)
+        grouped = pd.DataFrame({
+            'daily_temp_range': (stats['temp_max'] - stats['temp_min']).round(2),
+            'precip_total': stats['precip_hi'],
+            'hours_with_precip': stats['hours_with_precip'],
+            'wind_direction_mode': mode_from_counts(self.directions, stats.index),
+            'avg_wind_speed': (stats['wind_hi'] / wind_count).round(2),
+        }, index=stats.index)
+        return grouped.reset_index()
@@ -0,0 +1,67 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# column -> compact dtype applied once the derived metrics are computed. IDs and
+# labels repeat a lot and become categoricals, calendar fields fit in int8.
+# Columns that feed the reported values (temperature, precipitation,
+# wind_speed) stay float64 so the report does not change; the rest only feed
+# hourly means and are stored as float32.
+SCHEMA = {
+    'station_id': 'category',
+    'region': 'category',
+    'wind_direction': 'category',
+    'weather_condition': 'category',
+    'month': np.int8,
+    'day': np.int8,
+    'hour': np.int8,
+    'elevation': np.float32,
+    'humidity': np.float32,
+    'pressure': np.float32,
+    'feels_like': np.float32,
+    'heat_index': np.float32,
+}
+
+_UNITS = {'': 1, 'b': 1, 'kb': 1 << 10, 'mb': 1 << 20, 'gb': 1 << 30, 'tb': 1 << 40}
+
+
+def apply_schema(df, schema=None):
+    schema = SCHEMA if schema is None else schema
+    for col, dtype in schema.items():
+        if col in df and df[col].dtype != dtype:
+            if pd.api.types.is_integer_dtype(dtype) and df[col].isna().any():
+                continue  # calendar fields of unparsable timestamps stay float
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def parse_size(size):
+    # 512MB, 2gb, 1.5 GB or a plain number of bytes
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([a-zA-Z]*)\s*', size)
+    if not match or match.group(2).lower() not in _UNITS:
+        raise ValueError(f'cannot parse memory size {size!r}, use e.g. 512MB or 2GB')
+    return int(float(match.group(1)) * _UNITS[match.group(2).lower()])
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+class MemoryBudget:
+    # records the memory of the frame each pipeline stage hands on and raises
+    # once a stage goes over the limit (no limit only records)
+    def __init__(self, limit=None):
+        self.limit = parse_size(limit) if limit is not None else None
+        self.stages = {}
+
+    def record(self, stage, df):
+        used = self.stages[stage] = frame_bytes(df)
+        if self.limit is not None and used > self.limit:
+            raise MemoryError(f'stage {stage} uses {used} bytes, over the memory budget of {self.limit} bytes')
+        return df
+
+    def report(self):
+        return pd.DataFrame({'stage': list(self.stages), 'bytes': list(self.stages.values())})
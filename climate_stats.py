@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+
+class WelfordStats:
+    # per-key count, mean and sum of squared deviations (m2); partial statistics
+    # merge with Chan's parallel update and can be subtracted out again
+    def __init__(self, frame=None):
+        if frame is None:
+            frame = pd.DataFrame({'count': [], 'mean': [], 'm2': []}, dtype=float)
+        self.frame = frame
+
+    @classmethod
+    def from_values(cls, keys, values):
+        values = pd.Series(np.asarray(values, dtype=float))
+        grouped = values.groupby(np.asarray(keys))
+        count = grouped.count()
+        frame = pd.DataFrame({
+            'count': count.astype(float),
+            'mean': grouped.mean(),
+            'm2': grouped.var(ddof=0) * count,
+        })
+        return cls(frame[frame['count'] > 0])
+
+    def merge(self, other):
+        a, b = self.frame.align(other.frame, join='outer', fill_value=0.0)
+        count = a['count'] + b['count']
+        delta = b['mean'] - a['mean']
+        frame = pd.DataFrame({
+            'count': count,
+            'mean': a['mean'] + delta * (b['count'] / count),
+            'm2': a['m2'] + b['m2'] + delta ** 2 * a['count'] * b['count'] / count,
+        })
+        return WelfordStats(frame)
+
+    def subtract(self, other):
+        a, b = self.frame.align(other.frame, join='left', fill_value=0.0)
+        count = a['count'] - b['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (a['count'] * a['mean'] - b['count'] * b['mean']) / count
+            delta = b['mean'] - mean
+            m2 = a['m2'] - b['m2'] - delta ** 2 * count * b['count'] / a['count']
+        frame = pd.DataFrame({'count': count, 'mean': mean, 'm2': m2.clip(lower=0.0)})
+        return WelfordStats(frame[frame['count'] > 0])
+
+    def broadcast(self, keys):
+        # (mean, std) for every row of keys; only the distinct keys are looked up,
+        # rows reach their group by code, unknown or null keys get NaN
+        codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+        positions = self.frame.index.get_indexer(uniques)
+        rows = np.where(codes >= 0, positions[codes] if len(positions) else -1, -1)
+        mean = np.append(self.mean.to_numpy(dtype=float), np.nan)
+        std = np.append(self.std.to_numpy(dtype=float), np.nan)
+        return mean[rows], std[rows]
+
+    @property
+    def mean(self):
+        return self.frame['mean']
+
+    @property
+    def std(self):
+        count = self.frame['count']
+        return np.sqrt(self.frame['m2'] / (count - 1).where(count > 1))
@@ -0,0 +1,328 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from analyze_climate_corrected import (
+    guess_timestamp_format,
+    hourly_agg_dict,
+    mode_safe,
+    prepare_readings,
+    severity_report,
+)
+from climate_rollup import RegionDayRollup, mode_from_counts
+
+CHUNKSIZE = 100_000
+# merge the per-chunk hourly partials once this many have piled up
+COMPACT_EVERY = 8
+
+FORMATS = {
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+    '.npz': 'npz',
+}
+
+OUTPUT_FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+}
+
+
+def infer_format(path):
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix not in FORMATS:
+        raise ValueError(f'cannot infer the input format of {path}, pass one of {sorted(set(FORMATS.values()))}')
+    return FORMATS[suffix]
+
+
+def read_chunks(path, fmt=None, chunksize=CHUNKSIZE):
+    fmt = fmt or infer_format(path)
+    if fmt == 'jsonl':
+        with pd.read_json(path, lines=True, chunksize=chunksize, convert_dates=False, dtype=False) as reader:
+            yield from reader
+    elif fmt == 'csv':
+        with pd.read_csv(path, chunksize=chunksize) as reader:
+            yield from reader
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif fmt == 'arrow':
+        table = read_arrow(path)
+        for offset in range(0, table.num_rows, chunksize):
+            yield table.slice(offset, chunksize).to_pandas()
+    elif fmt == 'npz':
+        columns = read_npz(path)
+        n = len(next(iter(columns.values()), ()))
+        for offset in range(0, n, chunksize):
+            yield pd.DataFrame({col: values[offset:offset + chunksize] for col, values in columns.items()})
+    else:
+        raise ValueError(f'unsupported input format: {fmt}')
+
+
+def read_arrow(path):
+    # Arrow IPC file format, memory-mapped so the table's buffers are the file's pages
+    import pyarrow as pa
+
+    # the table's buffers keep the map open, so it is not closed here
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def read_npz(path):
+    # one array per column; strings must be stored as fixed-width unicode, object
+    # arrays would need pickle and are refused
+    with np.load(path, allow_pickle=False) as bundle:
+        return {col: bundle[col] for col in bundle.files}
+
+
+def read_frame(path, fmt=None):
+    # the whole file as one DataFrame for analyze_climate_data, built column by column
+    fmt = fmt or infer_format(path)
+    if fmt == 'jsonl':
+        return pd.read_json(path, lines=True, convert_dates=False, dtype=False)
+    if fmt == 'csv':
+        return pd.read_csv(path)
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    if fmt == 'arrow':
+        return read_arrow(path).to_pandas()
+    if fmt == 'npz':
+        return pd.DataFrame(read_npz(path))
+    raise ValueError(f'unsupported input format: {fmt}')
+
+
+def write_result(df, path, fmt=None):
+    if fmt is None:
+        suffix = os.path.splitext(path)[1].lower()
+        if suffix not in OUTPUT_FORMATS:
+            raise ValueError(f'cannot infer the output format of {path}, pass one of {sorted(set(OUTPUT_FORMATS.values()))}')
+        fmt = OUTPUT_FORMATS[suffix]
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'arrow':
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f'unsupported output format: {fmt}')
+
+
+def _two_sum(a, b):
+    total = a + b
+    b_part = total - a
+    return total, (a - (total - b_part)) + (b - b_part)
+
+
+def compensated_sums(codes, n_groups, values):
+    # per-group double-double sums (total, error) of the non-null values; the
+    # groups are walked one position at a time so every step is vectorized
+    codes = np.asarray(codes)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    total = np.zeros(n_groups)
+    error = np.zeros(n_groups)
+    if not len(codes):
+        return total, error
+    order = np.argsort(codes, kind='stable')
+    codes, values = codes[order], values[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    positions = np.arange(len(codes)) - np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+    by_position = np.argsort(positions, kind='stable')
+    bounds = np.searchsorted(positions[by_position], np.arange(positions.max() + 2))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        rows = by_position[lo:hi]
+        groups = codes[rows]
+        total[groups], step_error = _two_sum(total[groups], values[rows])
+        error[groups] += step_error
+    return total, error
+
+
+class HourlyPartials:
+    # mergeable per (station_id, hour) aggregation state: sums and counts for
+    # means, the earliest non-null value for first, value counts for modes.
+    # Sums keep the rounding error next to the pandas sum, so an hour split
+    # over several partials still merges to the correctly rounded total.
+    def __init__(self, stats, counts):
+        self.stats = stats
+        self.counts = counts
+
+    @classmethod
+    def from_readings(cls, df, agg_dict):
+        df = df[df['station_id'].notna()]
+        keys = [df['station_id'].to_numpy(), df.index.floor('h')]
+        names = ['station_id', 'timestamp']
+        grouped = df.groupby(keys, sort=False)
+        codes = grouped.ngroup().to_numpy()
+        stats = {}
+        counts = {}
+        for col, agg in agg_dict.items():
+            if col == 'station_id':
+                continue
+            if agg is mode_safe:
+                counts[col] = df.groupby(keys + [df[col].to_numpy()]).size().rename_axis(names + [col])
+            elif agg == 'first':
+                stats[col] = grouped[col].first()
+                seen = pd.Series(df.index, index=df.index).where(df[col].notna())
+                stats[col + '@ts'] = seen.groupby(keys, sort=False).min()
+            elif agg in ('sum', 'mean'):
+                total = grouped[col].sum()
+                exact, error = compensated_sums(codes, grouped.ngroups, df[col])
+                stats[col + '@sum'] = total
+                stats[col + '@err'] = (exact - total.to_numpy()) + error
+                if agg == 'mean':
+                    stats[col + '@count'] = grouped[col].count()
+            elif agg in ('max', 'min'):
+                stats[col] = grouped[col].agg(agg)
+            else:
+                raise ValueError(f'cannot aggregate {col} with {agg!r} incrementally')
+        stats = pd.DataFrame(stats)
+        stats.index.names = names
+        return cls(stats, counts)
+
+    @classmethod
+    def merge(cls, parts, agg_dict):
+        if len(parts) == 1:
+            return parts[0]
+        stats = pd.concat([part.stats for part in parts])
+        grouped = stats.groupby(level=[0, 1], sort=False)
+        sizes = grouped.size()
+        merged = pd.DataFrame(index=sizes.index)
+        codes = np.tile(grouped.ngroup().to_numpy(), 2)
+        single = sizes.to_numpy() == 1
+        counts = {}
+        for col, agg in agg_dict.items():
+            if col == 'station_id':
+                continue
+            if agg is mode_safe:
+                counts[col] = pd.concat([part.counts[col] for part in parts]).groupby(level=[0, 1, 2], sort=False).sum()
+            elif agg == 'first':
+                seen = stats[[col, col + '@ts']].dropna(subset=[col + '@ts'])
+                earliest = seen.sort_values(col + '@ts', kind='stable').groupby(level=[0, 1], sort=False).first()
+                merged[col] = earliest[col]
+                merged[col + '@ts'] = earliest[col + '@ts']
+            elif agg in ('sum', 'mean'):
+                parts_sum = np.concatenate([stats[col + '@sum'].to_numpy(), stats[col + '@err'].to_numpy()])
+                exact, error = compensated_sums(codes, len(sizes), parts_sum)
+                total = exact + error
+                error = (exact - total) + error
+                # hours that only one partial has seen keep their sums untouched
+                merged[col + '@sum'] = np.where(single, grouped[col + '@sum'].first(), total)
+                merged[col + '@err'] = np.where(single, grouped[col + '@err'].first(), error)
+                if agg == 'mean':
+                    merged[col + '@count'] = grouped[col + '@count'].sum()
+            else:
+                merged[col] = grouped[col].agg(agg)
+        return cls(merged, counts)
+
+    def select(self, mask):
+        keep = self.stats.index[mask]
+        counts = {}
+        for col, col_counts in self.counts.items():
+            counts[col] = col_counts[col_counts.index.droplevel(-1).isin(keep)]
+        return HourlyPartials(self.stats[mask], counts)
+
+    def finalize(self, agg_dict):
+        # one row per station-hour that received readings, indexed by (station_id, timestamp)
+        stats = self.stats
+        hourly = pd.DataFrame(index=stats.index)
+        for col, agg in agg_dict.items():
+            if col == 'station_id':
+                continue
+            if agg is mode_safe:
+                hourly[col] = mode_from_counts(self.counts[col], stats.index)
+            elif agg == 'mean':
+                total, count = stats[col + '@sum'], stats[col + '@count']
+                hourly[col] = (total / count.where(count > 0)).astype(float)
+            elif agg == 'sum':
+                hourly[col] = stats[col + '@sum']
+            else:
+                hourly[col] = stats[col]
+        return hourly
+
+
+class StreamingAnalyzer:
+    # feeds chunks of readings into hourly partials; with a lateness window the
+    # hours older than the newest reading minus lateness are closed and folded
+    # into the region/day rollup so only open station-hours stay in memory
+    def __init__(self, lateness=None, agg_dict=None, timestamp_format=None):
+        self.agg_dict = agg_dict or hourly_agg_dict()
+        self.lateness = pd.Timedelta(lateness) if lateness is not None else None
+        self.parts = []
+        self.pending = None
+        self.rollup = RegionDayRollup()
+        self.newest = None
+        self.closed_before = None
+        self.timestamp_format = timestamp_format
+
+    def add_chunk(self, chunk):
+        # without a declared format it is guessed from the first chunk and reused for the rest
+        if self.timestamp_format is None and len(chunk):
+            self.timestamp_format = guess_timestamp_format(np.asarray(chunk['timestamp'], dtype=object))
+        df = prepare_readings(chunk, self.timestamp_format)
+        df = df[df.index.notna()]  # the batch hourly groupby skips readings without a timestamp too
+        if self.pending is not None:
+            df = pd.concat([self.pending, df]).sort_index(kind='stable')
+            self.pending = None
+        if df.empty:
+            return
+        self.newest = df.index[-1] if self.newest is None else max(self.newest, df.index[-1])
+        # the newest hour can continue in the next chunk, holding its readings
+        # back keeps every station-hour of time-ordered input in one partial
+        tail = df.index >= df.index[-1].floor('h')
+        self.pending = df[tail]
+        self._absorb(df[~tail])
+        if self.lateness is not None:
+            self.close((self.newest - self.lateness).floor('h'))
+
+    def _absorb(self, df):
+        if df.empty:
+            return
+        if self.closed_before is not None and df.index[0].floor('h') < self.closed_before:
+            raise ValueError(
+                f'reading at {df.index[0]} arrived after its hour was closed, increase lateness'
+            )
+        self.parts.append(HourlyPartials.from_readings(df, self.agg_dict))
+        if len(self.parts) >= COMPACT_EVERY:
+            self.parts = [HourlyPartials.merge(self.parts, self.agg_dict)]
+
+    def close(self, before=None):
+        if not self.parts:
+            return
+        partials = HourlyPartials.merge(self.parts, self.agg_dict)
+        if before is None:
+            done = np.ones(len(partials.stats), dtype=bool)
+        else:
+            done = partials.stats.index.get_level_values('timestamp') < before
+            self.closed_before = before
+        if done.any():
+            hourly = partials.select(done).finalize(self.agg_dict)
+            self.rollup = self.rollup.merge(RegionDayRollup.from_hourly(hourly))
+        self.parts = [partials.select(~done)] if not done.all() else []
+
+    def result(self):
+        if self.pending is not None:
+            self._absorb(self.pending)
+            self.pending = None
+        self.close()
+        return severity_report(self.rollup.finalize())
+
+
+def analyze_climate_stream(chunks, lateness=None, timestamp_format=None):
+    analyzer = StreamingAnalyzer(lateness=lateness, timestamp_format=timestamp_format)
+    for chunk in chunks:
+        analyzer.add_chunk(chunk)
+    return analyzer.result()
@@ -0,0 +1,171 @@
+import functools
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# 默认最多缓存 64MB 的图表 JSON（按 UTF-8 编码后的字节数算）
+MAX_BYTES = 64 << 20
+
+
+def cache_version(*parts, files=()):
+    # 缓存版本：数据校验和、快照版本等，再加上画图代码文件的内容；
+    # 数据或代码任何一个变了，共享目录就换一个新的子目录
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode())
+    for path in files:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class FigureCache:
+    # 按 (回调名, 输入) 缓存已经序列化好的图表 JSON，超过内存上限时淘汰最久没用的；
+    # version 见 cache_version()，数据或画图代码变了缓存整体失效。
+    # 设置 directory 时每个图表还会写一份到这个共享目录（按版本分子目录），
+    # 所有 worker 进程内存未命中时先读目录，预热好的图表谁都不用再画
+    def __init__(self, max_bytes=MAX_BYTES, version=None, directory=None):
+        self.max_bytes = max_bytes
+        self.version = version
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def set_version(self, version):
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.bytes = 0
+                self.version = version
+
+    def _version_dir(self):
+        return os.path.join(self.directory, str(self.version)[:16])
+
+    def _path(self, key):
+        return os.path.join(self._version_dir(), hashlib.sha1(repr(key).encode()).hexdigest() + '.json')
+
+    def _read_shared(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def contains(self, key):
+        with self.lock:
+            if key in self.entries:
+                return True
+        return self.directory is not None and os.path.exists(self._path(key))
+
+    def get(self, key):
+        with self.lock:
+            encoded = self.entries.get(key)
+            if encoded is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return encoded
+        encoded = self._read_shared(key)
+        if encoded is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        self._remember(key, encoded)
+        with self.lock:
+            self.hits += 1
+        return encoded
+
+    def _remember(self, key, encoded):
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self.entries[key] = encoded
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def put(self, key, encoded):
+        self._remember(key, encoded)
+        if self.directory is not None:
+            # 先写临时文件再改名，其他进程不会读到写了一半的文件
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(encoded)
+            os.replace(tmp, path)
+
+    def prune(self):
+        # 删除旧快照版本留下的共享目录
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        current = os.path.basename(self._version_dir())
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and entry.name != current:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def memoize(self, name):
+        # 放在 @app.callback 下面；命中时直接把缓存的 JSON 解析成 dict 返回，不再重建图表。
+        # 缓存的是 UTF-8 字节，省掉的是画图和 to_json()；每次命中仍要 json.loads 一次，
+        # Dash 返回响应时还会再编码一次，点数多的图（比如邮编级地图）这部分开销不小
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = (name,) + args
+                encoded = self.get(key)
+                if encoded is None:
+                    encoded = func(*args).to_json().encode('utf-8')
+                    self.put(key, encoded)
+                return json.loads(encoded)
+            wrapper.uncached = func
+            wrapper.cache_name = name
+            return wrapper
+        return decorate
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def combinations(callback, *value_lists):
+    # 一个回调所有下拉取值组合的预热任务
+    return [(callback, args) for args in itertools.product(*value_lists)]
+
+
+def _render(module, callback_name, args):
+    # 在 worker 进程里导入应用模块再调用带缓存的回调，结果写进共享目录
+    getattr(importlib.import_module(module), callback_name)(*args)
+
+
+def warm_up(cache, module, jobs, workers=None):
+    # 预先渲染 jobs 里还没缓存的 (回调, 参数)；有共享目录时用进程池并行，
+    # 否则在当前进程里依次渲染进内存缓存
+    cache.prune()
+    todo = [(callback, args) for callback, args in jobs if not cache.contains((callback.cache_name,) + args)]
+    if workers != 1 and cache.directory is not None and len(todo) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(_render, itertools.repeat(module), [callback.__name__ for callback, _ in todo], [args for _, args in todo]))
+    else:
+        for callback, args in todo:
+            callback(*args)
+    return len(todo)
@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import json
+import os
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+# 只读取仪表盘需要的列
+EV_COLUMNS = [
+    'County', 'City', 'Postal Code', 'Model Year', 'Make', 'Model',
+    'Electric Vehicle Type', 'Electric Range', 'Electric Utility'
+]
+
+# 重复度高的文本列转成 category，年份和续航用小整数
+CATEGORY_COLUMNS = ['County', 'City', 'Postal Code', 'Make', 'Model', 'Electric Vehicle Type', 'Electric Utility']
+INT_COLUMNS = {'Model Year': 'int16', 'Electric Range': 'int16'}
+
+# 车辆位置（"POINT (经度 纬度)"）拆成两列 float32，用来算城市和邮编的地图坐标；
+# 这一列缺失或为空不影响其他统计
+LOCATION_COLUMN = 'Vehicle Location'
+COORDINATE_COLUMNS = {'Longitude': 'float32', 'Latitude': 'float32'}
+
+CHUNKSIZE = 200_000
+
+
+def ensure_local_copy(path, url):
+    # 本地没有文件时下载一次，以后启动都读本地文件
+    if not os.path.exists(path):
+        tmp = path + '.part'
+        urllib.request.urlretrieve(url, tmp)
+        os.replace(tmp, path)
+    return path
+
+
+def _read_dtypes():
+    # 读取时文本列先用 str，分块拼接后再统一转 category，避免各块类别不一致
+    dtypes = {col: str for col in CATEGORY_COLUMNS + [LOCATION_COLUMN]}
+    dtypes.update({col: 'Float64' for col in INT_COLUMNS})
+    return dtypes
+
+
+def load_ev_data(path, years=(2023, 2024), chunksize=CHUNKSIZE):
+    # 分块读取需要的列，边读边按车型年份过滤
+    parts = []
+    reader = pd.read_csv(
+        path,
+        usecols=lambda col: col in EV_COLUMNS or col == LOCATION_COLUMN,
+        dtype=_read_dtypes(),
+        chunksize=chunksize,
+    )
+    with reader:
+        for chunk in reader:
+            parts.append(chunk[chunk['Model Year'].isin(years)])
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+    for col in EV_COLUMNS + [LOCATION_COLUMN]:
+        if col not in df.columns:
+            df[col] = pd.NA
+    df = df.dropna(subset=EV_COLUMNS)
+    coordinates = df[LOCATION_COLUMN].str.extract(r'POINT \(\s*(\S+)\s+(\S+)\s*\)')
+    df[list(COORDINATE_COLUMNS)] = coordinates.apply(pd.to_numeric, errors='coerce').to_numpy()
+    df = df[EV_COLUMNS + list(COORDINATE_COLUMNS)]
+
+    # 邮政编码统一成不带小数的字符串
+    postal = df['Postal Code'].str.strip()
+    df['Postal Code'] = postal.str.replace(r'\.0+$', '', regex=True)
+    df = df.astype({col: 'category' for col in CATEGORY_COLUMNS})
+    df = df.astype({**INT_COLUMNS, **COORDINATE_COLUMNS})
+    return df.reset_index(drop=True)
+
+
+# 定义主要城市列表
+MAJOR_CITIES = [
+    'Seattle', 'Bellevue', 'Redmond', 'Kirkland', 'Tacoma',
+    'Spokane', 'Vancouver', 'Olympia', 'Bellingham', 'Everett'
+]
+
+SNAPSHOT_VERSION = 2
+
+
+def compute_dimensions(df_total, major_cities=MAJOR_CITIES):
+    # 下拉框和统计卡片用到的唯一值列表
+    present = set(df_total['City'].unique())
+    return {
+        'unique_years': sorted(int(year) for year in df_total['Model Year'].unique()),
+        'unique_makes': sorted(df_total['Make'].unique()),
+        'unique_types': sorted(df_total['Electric Vehicle Type'].unique()),
+        'top_makes': df_total['Make'].value_counts().head(15).index.tolist(),
+        'available_cities': [city for city in major_cities if city in present],
+    }
+
+
+def source_checksum(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def build_snapshot(source, snapshot_path):
+    # 清洗后的 df_total 写成不压缩的 Feather（Arrow IPC），维度列表和源文件校验和放在 schema 元数据里
+    import pyarrow as pa
+
+    df_total = load_ev_data(source)
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'source_sha256': source_checksum(source),
+        **_source_stat(source),
+        **compute_dimensions(df_total),
+    }
+    _write_snapshot(pa.Table.from_pandas(df_total, preserve_index=False), meta, snapshot_path)
+    return df_total, meta
+
+
+def _write_snapshot(table, meta, snapshot_path):
+    import pyarrow.feather as feather
+
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'ev_snapshot': json.dumps(meta).encode()})
+    # 临时文件名带进程号，几个 worker 同时重写快照时不会写进同一个文件
+    tmp = f'{snapshot_path}.{os.getpid()}.tmp'
+    feather.write_feather(table, tmp, compression='uncompressed')
+    os.replace(tmp, snapshot_path)
+
+
+def _snapshot_meta(table):
+    raw = (table.schema.metadata or {}).get(b'ev_snapshot')
+    return json.loads(raw) if raw else None
+
+
+def _is_current(meta, source):
+    if meta is None or meta.get('version') != SNAPSHOT_VERSION:
+        return False
+    if not os.path.exists(source):
+        return True  # 没有源文件时直接用快照
+    if all(meta.get(key) == value for key, value in _source_stat(source).items()):
+        return True
+    # 大小或修改时间变了，再用校验和确认内容是否真的变化
+    return meta.get('source_sha256') == source_checksum(source)
+
+
+def load_snapshot(source, snapshot_path):
+    # 快照以内存映射方式打开；源文件变化或快照不存在时重新生成
+    import pyarrow.feather as feather
+
+    if os.path.exists(snapshot_path):
+        table = feather.read_table(snapshot_path, memory_map=True)
+        meta = _snapshot_meta(table)
+        if _is_current(meta, source):
+            stat = _source_stat(source) if os.path.exists(source) else {}
+            if any(meta.get(key) != value for key, value in stat.items()):
+                # 内容没变（重新下载或 touch 过），更新记录的大小和修改时间，以后启动不用再算校验和
+                meta = {**meta, **stat}
+                _write_snapshot(table, meta, snapshot_path)
+            return table.to_pandas(split_blocks=True), meta
+    return build_snapshot(source, snapshot_path)
+
+
+
+# 预聚合立方体的维度，回调只需要在这几十到几千行上做筛选和汇总
+CUBE_DIMENSIONS = ['Model Year', 'Make', 'Electric Vehicle Type', 'County', 'City', 'Postal Code', 'Zero Range']
+
+
+def build_cube(df_total):
+    # 每个维度组合的车辆数，以及非零续航的续航总和与条数（用于求平均续航）
+    # 直接用列做分组键，不复制 df_total
+    zero_range = (df_total['Electric Range'] == 0).rename('Zero Range')
+    keys = [df_total[col] for col in CUBE_DIMENSIONS[:-1]] + [zero_range]
+    grouped = df_total['Electric Range'].where(~zero_range, 0).astype('int64').groupby(keys, observed=True)
+    frame = grouped.size().to_frame('Count')
+    frame['Range Sum'] = grouped.sum()
+    frame['Range Count'] = frame['Count'].where(~frame.index.get_level_values('Zero Range'), 0)
+    return EVCube(frame.reset_index())
+
+
+class EVCube:
+    # 立方体表，加上按年份、品牌、城市、零续航预先算好的行掩码；
+    # 回调筛选时只做掩码的与/或运算，不筛选的维度直接返回原表，不复制
+    MASKED = ['Model Year', 'Make', 'City', 'Zero Range']
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.masks = {
+            col: {value: (frame[col] == value).to_numpy() for value in frame[col].unique()}
+            for col in self.MASKED
+        }
+        self.nothing = np.zeros(len(frame), dtype=bool)
+
+    def mask(self, col, value):
+        return self.masks[col].get(value, self.nothing)
+
+    def slice(self, year='all', make='all', zero_range=None, cities=None):
+        # 'all' / None 表示不按该维度筛选
+        selected = []
+        if year != 'all':
+            selected.append(self.mask('Model Year', year))
+        if make != 'all':
+            selected.append(self.mask('Make', make))
+        if zero_range is not None:
+            selected.append(self.mask('Zero Range', zero_range))
+        if cities is not None:
+            selected.append(np.logical_or.reduce([self.mask('City', city) for city in cities] + [self.nothing]))
+        if not selected:
+            return self.frame
+        return self.frame[np.logical_and.reduce(selected)]
+
+
+def cube_counts(cube, by):
+    # 和 value_counts() 一样按数量降序，数量相同时按类别顺序
+    counts = cube.groupby(by, observed=True)['Count'].sum()
+    if isinstance(by, str):
+        counts = counts.sort_values(ascending=False, kind='stable')
+    return counts
+
+
+def cube_mean_range(cube, by):
+    totals = cube.groupby(by, observed=True)[['Range Sum', 'Range Count']].sum()
+    totals = totals[totals['Range Count'] > 0]
+    return (totals['Range Sum'] / totals['Range Count']).rename('Electric Range')
+
+
+# 县中心坐标
+COUNTY_CENTROIDS = {
+    'KING': [47.4902, -121.8344], 'PIERCE': [47.0244, -122.1034], 'SNOHOMISH': [48.0464, -121.6977],
+    'SPOKANE': [47.6202, -117.4040], 'CLARK': [45.7793, -122.4824], 'THURSTON': [47.5047, -120.4857],
+    'KITSAP': [47.6394, -122.6474], 'YAKIMA': [46.4571, -120.7383], 'WHATCOM': [48.8258, -121.7231],
+    'FRANKLIN': [46.5348, -118.8989], 'BENTON': [46.2395, -119.5108], 'SKAGIT': [48.4790, -121.7309],
+    'ISLAND': [48.1633, -122.5213], 'CLALLAM': [48.0496, -123.9271], 'LEWIS': [46.5776, -122.3929],
+    'COWLITZ': [46.1935, -122.6812], 'GRANT': [47.2059, -119.4514], 'MASON': [47.3508, -123.1854],
+    'GRAYS HARBOR': [47.1496, -123.7733], 'CHELAN': [47.8692, -120.6199], 'OKANOGAN': [48.5488, -119.7400],
+    'STEVENS': [48.3991, -117.8551], 'JEFFERSON': [47.7495, -123.5927], 'WHITMAN': [46.9012, -117.5238],
+    'DOUGLAS': [47.7362, -119.6919], 'KITTITAS': [47.1244, -120.6796], 'WALLA WALLA': [46.2298, -118.4784],
+    'PACIFIC': [46.5556, -123.7008], 'SAN JUAN': [48.5780, -122.9671], 'LINCOLN': [47.5762, -118.4189],
+    'ADAMS': [46.9832, -118.5606], 'FERRY': [48.4702, -118.5171], 'ASOTIN': [46.1911, -117.2035],
+    'COLUMBIA': [46.2973, -117.9074], 'GARFIELD': [46.4315, -117.5454], 'KLICKITAT': [45.8737, -120.7883],
+    'SKAMANIA': [46.0230, -121.9149], 'WAHKIAKUM': [46.2911, -123.4245], 'PEND OREILLE': [48.5323, -117.2743]
+}
+# 查不到的县放在州中心
+DEFAULT_CENTROID = [47.5, -120.5]
+
+# 地图可以按这几级地理单位画气泡
+MAP_LEVELS = ['County', 'City', 'Postal Code']
+
+
+def centroid_table(df_total, level):
+    # 每个类别一行经纬度，行顺序就是该列的 category 编码顺序，回调里直接用分组结果的编码取坐标；
+    # 县用 COUNTY_CENTROIDS，城市和邮编用车辆位置的平均值（没有位置数据的为 NaN）
+    categories = df_total[level].cat.categories
+    if level == 'County':
+        coords = [COUNTY_CENTROIDS.get(str(name).upper(), DEFAULT_CENTROID) for name in categories]
+        return pd.DataFrame(coords, index=categories, columns=['lat', 'lon'])
+    located = df_total.groupby(level, observed=False)[['Latitude', 'Longitude']].mean()
+    return located.set_axis(['lat', 'lon'], axis=1).astype('float64').reindex(categories)
+
+
+class MarketShareMatrix:
+    # 城市 × 品牌的车辆数，启动时从立方体算一次；
+    # shares() 再从这张小表里取前 top_n 品牌和指定城市，算市场份额
+    def __init__(self, counts):
+        counts = counts.copy()
+        counts.index = pd.Index(list(counts.index), name='City')
+        counts.columns = pd.Index(list(counts.columns), name='Make')
+        self.counts = counts
+
+    @classmethod
+    def from_cube(cls, cube):
+        return cls(cube_counts(cube.frame, ['City', 'Make']).unstack('Make', fill_value=0))
+
+    def top_brands(self, top_n):
+        # 和 cube_counts 一样按数量降序，数量相同时按品牌名
+        return self.counts.sum().sort_values(ascending=False, kind='stable').head(top_n).index
+
+    def shares(self, top_n=5, cities=None):
+        # 市场份额（%）：只看总数前 top_n 的品牌（None 为全部品牌），份额按这些品牌
+        # 在该城市的合计计算；cities 为 None 时包含所有城市
+        counts = self.counts
+        if cities is not None:
+            counts = counts[counts.index.isin(cities)]
+        if top_n is not None:
+            counts = counts.loc[:, counts.columns.isin(self.top_brands(top_n))]
+        counts = counts.loc[counts.sum(axis=1) > 0, counts.sum() > 0]
+        return counts.div(counts.sum(axis=1), axis=0) * 100
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the EV dashboard snapshot from the source CSV.')
+    parser.add_argument('source', help='Electric Vehicle Population CSV')
+    parser.add_argument('snapshot', help='Feather file to write')
+    args = parser.parse_args()
+    df_total, meta = build_snapshot(args.source, args.snapshot)
+    print(f"Snapshot written: {len(df_total):,} records, source sha256 {meta['source_sha256'][:12]}")
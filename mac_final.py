@@ -1,13 +1,23 @@
-import pandas as pd
+import os
+
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 import dash
-from dash import dcc, html, Input, Output, callback
+from dash import dcc, html, Input, Output, callback, ctx
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import warnings
 warnings.filterwarnings('ignore')
 from pyngrok import ngrok
 
+from ev_cache import FigureCache, cache_version, combinations, warm_up
+from ev_data import (
+    MAP_LEVELS, MarketShareMatrix, build_cube, centroid_table, cube_counts, cube_mean_range,
+    ensure_local_copy, load_snapshot,
+)
+import ev_data
+
 ngrok.set_auth_token("34vOkgLqP76cPjUXXBJ4kveVtJF_4sJEYX98i61Psg3ZhBGB6")
 
 
@@ -26,78 +36,69 @@ print("Website Creating...")
 #     print(f"File cannot read: {e}")
 #     exit()
 
-读取数据
+# 读取数据 - 优先打开预先生成的快照，源文件变化时才重新清洗
 file_id = "1-UbtcgNgJlUlGXhrF4hAZC9yTr1PGfRs"
 download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
+data_path = os.environ.get('EV_DATA_PATH', 'Electric_Vehicle_Population_Data.csv')
+snapshot_path = os.environ.get('EV_SNAPSHOT_PATH', 'ev_snapshot.feather')
 
 try:
-    df = pd.read_csv(download_url)
-    print("✅ Successfully loaded data from Google Drive")
+    if not os.path.exists(snapshot_path):
+        ensure_local_copy(data_path, download_url)
+    df_total, dimensions = load_snapshot(data_path, snapshot_path)
+    print(f"✅ Successfully loaded data from {snapshot_path}")
 except Exception as e:
     print(f"❌ Failed to load file: {e}")
     exit()
 
-# 筛选2023和2024年的数据
-df_total = df[df['Model Year'].isin([2023, 2024])].copy()
-
-# 数据清洗
-columns_to_keep = [
-    'County', 'City', 'Postal Code', 'Model Year', 'Make', 'Model',
-    'Electric Vehicle Type', 'Electric Range', 'Electric Utility'
-]
-
-for col in columns_to_keep:
-    if col not in df_total.columns:
-        df_total[col] = pd.NA
-
-df_total = df_total[columns_to_keep].copy()
-df_total.dropna(inplace=True)
-
-# 确保邮政编码是字符串类型
-try:
-    df_total['Postal Code'] = df_total['Postal Code'].astype(int).astype(str)
-except:
-    df_total['Postal Code'] = df_total['Postal Code'].astype(str)
-
 print(f"Data loaded: {len(df_total):,} records for years 2023 and 2024.")
 
-# 定义主要城市列表
-major_cities = [
-    'Seattle', 'Bellevue', 'Redmond', 'Kirkland', 'Tacoma',
-    'Spokane', 'Vancouver', 'Olympia', 'Bellingham', 'Everett'
-]
+# 预聚合立方体，所有回调都从这里取数
+ev_cube = build_cube(df_total)
 
-# 检查哪些城市在数据中存在
-available_cities = []
-for city in major_cities:
-    city_data = df_total[df_total['City'] == city]
-    if len(city_data) > 0:
-        available_cities.append(city)
+# 图表缓存，数据快照（源文件校验和、快照版本）或画图代码变化时失效；
+# EV_FIGURE_CACHE_DIR 是所有 worker 共用的缓存目录
+figure_cache = FigureCache(
+    int(os.environ.get('EV_FIGURE_CACHE_BYTES', 64 << 20)),
+    directory=os.environ.get('EV_FIGURE_CACHE_DIR', 'ev_figure_cache'),
+)
+figure_cache.set_version(cache_version(
+    dimensions.get('source_sha256'), ev_data.SNAPSHOT_VERSION,
+    files=[os.path.abspath(__file__), ev_data.__file__],
+))
+
+# 主要城市中数据里存在的城市
+available_cities = dimensions['available_cities']
 
 print(f"Available Cities: {len(available_cities)} 个")
 
-# 县坐标数据
-county_centroids = {
-    'KING': [47.4902, -121.8344], 'PIERCE': [47.0244, -122.1034], 'SNOHOMISH': [48.0464, -121.6977],
-    'SPOKANE': [47.6202, -117.4040], 'CLARK': [45.7793, -122.4824], 'THURSTON': [47.5047, -120.4857],
-    'KITSAP': [47.6394, -122.6474], 'YAKIMA': [46.4571, -120.7383], 'WHATCOM': [48.8258, -121.7231],
-    'FRANKLIN': [46.5348, -118.8989], 'BENTON': [46.2395, -119.5108], 'SKAGIT': [48.4790, -121.7309],
-    'ISLAND': [48.1633, -122.5213], 'CLALLAM': [48.0496, -123.9271], 'LEWIS': [46.5776, -122.3929],
-    'COWLITZ': [46.1935, -122.6812], 'GRANT': [47.2059, -119.4514], 'MASON': [47.3508, -123.1854],
-    'GRAYS HARBOR': [47.1496, -123.7733], 'CHELAN': [47.8692, -120.6199], 'OKANOGAN': [48.5488, -119.7400],
-    'STEVENS': [48.3991, -117.8551], 'JEFFERSON': [47.7495, -123.5927], 'WHITMAN': [46.9012, -117.5238],
-    'DOUGLAS': [47.7362, -119.6919], 'KITTITAS': [47.1244, -120.6796], 'WALLA WALLA': [46.2298, -118.4784],
-    'PACIFIC': [46.5556, -123.7008], 'SAN JUAN': [48.5780, -122.9671], 'LINCOLN': [47.5762, -118.4189],
-    'ADAMS': [46.9832, -118.5606], 'FERRY': [48.4702, -118.5171], 'ASOTIN': [46.1911, -117.2035],
-    'COLUMBIA': [46.2973, -117.9074], 'GARFIELD': [46.4315, -117.5454], 'KLICKITAT': [45.8737, -120.7883],
-    'SKAMANIA': [46.0230, -121.9149], 'WAHKIAKUM': [46.2911, -123.4245], 'PEND OREILLE': [48.5323, -117.2743]
-}
+# 热力图的品牌数和城市范围：EV_HEATMAP_TOP_BRANDS=0 表示全部品牌，
+# EV_HEATMAP_CITIES 可以是 major（主要城市）、all（所有城市）或逗号分隔的城市列表
+heatmap_top_n = int(os.environ.get('EV_HEATMAP_TOP_BRANDS', 5)) or None
+heatmap_city_setting = os.environ.get('EV_HEATMAP_CITIES', 'major')
+if heatmap_city_setting == 'major':
+    heatmap_cities = available_cities
+elif heatmap_city_setting == 'all':
+    heatmap_cities = None
+else:
+    heatmap_cities = [city.strip() for city in heatmap_city_setting.split(',') if city.strip()]
+
+# 城市 × 品牌车辆数只统计一次，热力图用的份额矩阵也在启动时算好
+market_shares = MarketShareMatrix.from_cube(ev_cube)
+heatmap_matrix = market_shares.shares(heatmap_top_n, heatmap_cities)
+heatmap_title = "Market Share of {} EV Brands Across {}".format(
+    f'Top {heatmap_top_n}' if heatmap_top_n else 'All',
+    'Major WA Cities' if heatmap_city_setting == 'major' else 'WA Cities',
+)
+
+# 各级地理单位的中心坐标表（按 category 编码顺序），地图回调直接按编码取
+map_centroids = {level: centroid_table(df_total, level) for level in MAP_LEVELS}
 
-# 获取唯一值
-unique_years = sorted(df_total['Model Year'].unique())
-unique_makes = sorted(df_total['Make'].unique())
-unique_types = sorted(df_total['Electric Vehicle Type'].unique())
-top_makes = df_total['Make'].value_counts().head(15).index.tolist()
+# 获取唯一值（快照里已预先算好）
+unique_years = dimensions['unique_years']
+unique_makes = dimensions['unique_makes']
+unique_types = dimensions['unique_types']
+top_makes = dimensions['top_makes']
 
 print(f"Model Year: {unique_years}")
 print(f"Brands: {len(unique_makes)} 个")
@@ -283,8 +284,8 @@ dbc.Row([
         dbc.Col([
             dbc.Card([
                 dbc.CardHeader([
-                    html.H5("EV Population by County in Washington State Map", className="card-title mb-0", style={'font-size': '16px'}),
-                    html.P("EV Population by County", style={'color': '#5D6D7E', 'font-size': '12px', 'margin': '0'})
+                    html.H5("EV Population in Washington State Map", className="card-title mb-0", style={'font-size': '16px'}),
+                    html.P("EV Population by County, City or Postal Code", style={'color': '#5D6D7E', 'font-size': '12px', 'margin': '0'})
                 ], style={'padding': '12px', 'border-bottom': '1px solid rgba(0,0,0,0.05)'}),
                 dbc.CardBody([
                     dbc.Row([
@@ -301,7 +302,7 @@ dbc.Row([
                                 clearable=False,
                                 style={'margin-bottom': '10px', 'font-size': '14px'}
                             )
-                        ], width=6),
+                        ], width=4),
                         dbc.Col([
                             html.Label("Brands:", className="fw-bold", style={'font-size': '14px'}),
                             dcc.Dropdown(
@@ -312,7 +313,17 @@ dbc.Row([
                                 clearable=False,
                                 style={'font-size': '14px'}
                             )
-                        ], width=6)
+                        ], width=4),
+                        dbc.Col([
+                            html.Label("Level:", className="fw-bold", style={'font-size': '14px'}),
+                            dcc.Dropdown(
+                                id='bubble-level-dropdown',
+                                options=[{'label': level, 'value': level} for level in MAP_LEVELS],
+                                value='County',
+                                clearable=False,
+                                style={'font-size': '14px'}
+                            )
+                        ], width=4)
                     ], style={'margin-bottom': '15px'}),
                     dcc.Graph(
                         id='ev-bubble-map',
@@ -424,7 +435,7 @@ dbc.Row([
             dbc.Card([
                 dbc.CardHeader([
                     html.H5(
-                        "Market Share of Top 5 EV Brands Across Major WA Cities",
+                        heatmap_title,
                         className="card-title mb-0",
                         style={'font-size': '16px'}
                     ),
@@ -434,6 +445,12 @@ dbc.Row([
                     )
                 ], style={'padding': '12px', 'border-bottom': '1px solid rgba(0,0,0,0.05)'}),
                 dbc.CardBody([
+                    dcc.Checklist(
+                        id='heatmap-highlight',
+                        options=[{'label': ' Highlight the city selected above', 'value': 'city'}],
+                        value=[],
+                        style={'margin-bottom': '10px', 'font-size': '14px'}
+                    ),
                     dcc.Graph(
                         id='heatmap-chart',
                         style={'height': '600px', 'width': '100%'},
@@ -501,12 +518,12 @@ dbc.Row([
     [Input('range-year-dropdown', 'value'),
      Input('range-chart-dropdown', 'value')]
 )
+@figure_cache.memoize('range-chart')
 def update_range_chart(selected_year, selected_chart):
+    filtered_cube = ev_cube.slice(year=selected_year)
     if selected_year == 'all':
-        filtered_df = df_total.copy()
         title_suffix = "Model Year (2023–2024)"
     else:
-        filtered_df = df_total[df_total['Model Year'] == selected_year].copy()
         title_suffix = f"Model Year {selected_year}"
 
     # 初始化空图表
@@ -516,8 +533,7 @@ def update_range_chart(selected_year, selected_chart):
     # ① 电池续航为0的车辆
     # ——————————————
     if selected_chart == 'zero_range':
-        zero_range_data = filtered_df[filtered_df['Electric Range'] == 0]
-        brand_counts = zero_range_data['Make'].value_counts()
+        brand_counts = cube_counts(ev_cube.slice(year=selected_year, zero_range=True), 'Make')
 
     # ✅ 自动调整高度，确保所有品牌标签显示
         chart_height = max(500, len(brand_counts) * 35)
@@ -551,8 +567,7 @@ def update_range_chart(selected_year, selected_chart):
     # ② 品牌平均续航
     # ——————————————
     elif selected_chart == 'avg_range_brand':
-        non_zero_df = filtered_df[filtered_df['Electric Range'] > 0]
-        avg_range = non_zero_df.groupby('Make')['Electric Range'].mean().sort_values(ascending=True)
+        avg_range = cube_mean_range(filtered_cube, 'Make').sort_values(ascending=True)
 
         chart_height = max(500, len(avg_range) * 35)
 
@@ -573,8 +588,7 @@ def update_range_chart(selected_year, selected_chart):
     # ③ 品牌+类型组合平均续航
     # ——————————————
     elif selected_chart == 'avg_range_brand_type':
-        non_zero_df = filtered_df[filtered_df['Electric Range'] > 0]
-        avg_range = non_zero_df.groupby(['Make', 'Electric Vehicle Type'])['Electric Range'].mean().reset_index()
+        avg_range = cube_mean_range(filtered_cube, ['Make', 'Electric Vehicle Type']).reset_index()
         avg_range = avg_range.sort_values('Electric Range', ascending=True)
 
         chart_height = max(600, len(avg_range['Make'].unique()) * 35)
@@ -596,8 +610,7 @@ def update_range_chart(selected_year, selected_chart):
     # ④ 车辆类型平均续航
     # ——————————————
     elif selected_chart == 'avg_range_type':
-        non_zero_df = filtered_df[filtered_df['Electric Range'] > 0]
-        avg_range = non_zero_df.groupby('Electric Vehicle Type')['Electric Range'].mean().sort_values(ascending=True)
+        avg_range = cube_mean_range(filtered_cube, 'Electric Vehicle Type').sort_values(ascending=True)
 
         fig = px.bar(
             x=avg_range.values,
@@ -650,77 +663,65 @@ def update_range_chart(selected_year, selected_chart):
     return fig
 
 
-def format_number(num): 
-    if num >= 1000: 
-        return f"{num/1000:.1f}k".replace('.0k', 'k') 
-    else: 
-        return str(num)
+def format_numbers(counts):
+    # 1000 以上显示成 1.2k（整千显示 2k），整列一起格式化
+    counts = np.asarray(counts)
+    thousands = np.char.replace(np.char.mod('%.1fk', counts / 1000), '.0k', 'k')
+    return np.where(counts >= 1000, thousands, counts.astype(str))
+
+
+def marker_sizes(counts):
+    # 对数缩放，使数量差异更平滑；0 用更小的基础气泡，最大 40
+    counts = np.asarray(counts, dtype=float)
+    sizes = np.minimum(10 + 20 * (np.log10(counts + 1) / np.log10(1000)), 40)
+    return np.where(counts == 0, 8, sizes)
     
 # 回调函数 - 专题地图（自适应页面大小 + 气泡尺寸整体缩小一倍）
 @app.callback(
     Output('ev-bubble-map', 'figure'),
     [Input('bubble-year-dropdown', 'value'),
-     Input('bubble-make-dropdown', 'value')]
+     Input('bubble-make-dropdown', 'value'),
+     Input('bubble-level-dropdown', 'value')]
 )
-def update_thematic_map(selected_year, selected_make):
+@figure_cache.memoize('ev-bubble-map')
+def update_thematic_map(selected_year, selected_make, selected_level='County'):
     # 数据过滤
-    filtered_df = df_total.copy()
-    if selected_year != 'all':
-        filtered_df = filtered_df[filtered_df['Model Year'] == selected_year]
-    if selected_make != 'all':
-        filtered_df = filtered_df[filtered_df['Make'] == selected_make]
-    
-    # 按县统计数量
-    county_counts_filtered = filtered_df.groupby('County').size().reset_index(name='Vehicle Count')
-    county_counts_filtered['County_Upper'] = county_counts_filtered['County'].str.upper()
-    
-    # 匹配经纬度
-    county_counts_filtered['lat'] = county_counts_filtered['County_Upper'].map(
-        lambda x: county_centroids.get(x, [47.5, -120.5])[0]
-    )
-    county_counts_filtered['lon'] = county_counts_filtered['County_Upper'].map(
-        lambda x: county_centroids.get(x, [47.5, -120.5])[1]
-    )
+    filtered_cube = ev_cube.slice(year=selected_year, make=selected_make)
     
-    # 调整气泡尺寸公式（整体缩小一倍 + 优化对数变化）
-    import math
-    def get_marker_size(count):
-        if count == 0:
-            return 8  # 更小的基础气泡
-        # 对数缩放，使数量差异更平滑
-        size = 10 + 20 * (math.log10(count + 1) / math.log10(1000))  # 原来是 20 + 40
-        return min(size, 40)  # 最大尺寸由 80 缩小到 40
-    
-    county_counts_filtered['marker_size'] = county_counts_filtered['Vehicle Count'].apply(get_marker_size)
+    # 按县（或城市、邮编）统计数量，用分组结果的 category 编码取中心坐标
+    counts = filtered_cube.groupby(selected_level, observed=True)['Count'].sum()
+    centroids = map_centroids[selected_level].to_numpy()[counts.index.codes]
+    located = ~np.isnan(centroids).any(axis=1)  # 没有位置数据的城市/邮编不画
+    names = counts.index.astype(str).to_numpy()[located]
+    vehicle_counts = counts.to_numpy()[located]
+    centroids = centroids[located]
     
     # 创建地图
     fig = go.Figure()
     
-    if len(county_counts_filtered) > 0:
+    if len(vehicle_counts) > 0:
         # 添加紫色气泡
         fig.add_trace(go.Scattermapbox(
-            lat=county_counts_filtered['lat'],
-            lon=county_counts_filtered['lon'],
+            lat=centroids[:, 0],
+            lon=centroids[:, 1],
             mode='markers',
             marker=dict(
-                size=county_counts_filtered['marker_size'],
+                size=marker_sizes(vehicle_counts),
                 color='#8A2BE2',
                 opacity=0.85,
                 sizemode='diameter'
             ),
-            text=county_counts_filtered.apply(
-                lambda x: f"{x['County']}<br>EV Number: {x['Vehicle Count']:,}", 
-                axis=1
-            ),
-            hoverinfo='text'
+            text=names,
+            customdata=vehicle_counts,
+            hovertemplate='%{text}<br>EV Number: %{customdata:,}<extra></extra>'
         ))
         
         # 添加白色数字标注
         fig.add_trace(go.Scattermapbox(
-            lat=county_counts_filtered['lat'],
-            lon=county_counts_filtered['lon'],
+            lat=centroids[:, 0],
+            lon=centroids[:, 1],
             mode='text',
-            text=county_counts_filtered['Vehicle Count'].apply(format_number),
+            text=format_numbers(vehicle_counts),
             textfont=dict(
                 size=13,
                 color='white',
@@ -743,7 +744,7 @@ def update_thematic_map(selected_year, selected_make):
                     f'<span style="font-size:14px; color:#666">'
                     f'Filter: {selected_year if selected_year != "all" else "Model Year"} | '
                     f'{selected_make if selected_make != "all" else "Make"} | '
-                    f'Total: {county_counts_filtered["Vehicle Count"].sum():,}</span>',
+                    f'Total: {counts.sum():,}</span>',
             'x': 0.5,
             'xanchor': 'center',
             'font': {'size': 16, 'color': '#2E4057'}
@@ -762,15 +763,14 @@ def update_thematic_map(selected_year, selected_make):
     Output('brand-chart', 'figure'),
     [Input('brand-year-dropdown', 'value')]
 )
+@figure_cache.memoize('brand-chart')
 def update_brand_chart(selected_year):
     if selected_year == 'all':
-        filtered_df = df_total.copy()
         title_suffix = "Model Year (2023-2024)"
     else:
-        filtered_df = df_total[df_total['Model Year'] == selected_year]
         title_suffix = f"{selected_year} Model Year"
     
-    brand_counts = filtered_df['Make'].value_counts()
+    brand_counts = cube_counts(ev_cube.slice(year=selected_year), 'Make')
     
     # Dynamic height
     per_brand_height = 40
@@ -827,6 +827,7 @@ def update_brand_chart(selected_year):
     Output('city-brand-chart', 'figure'),
     [Input('city-dropdown', 'value')]
 )
+@figure_cache.memoize('city-brand-chart')
 def update_city_brand_chart(selected_city):
     if not selected_city:
         fig = go.Figure()
@@ -840,8 +841,8 @@ def update_city_brand_chart(selected_city):
         )
         return fig
 
-    city_data = df_total[df_total['City'] == selected_city]
-    if city_data.empty:
+    city_cube = ev_cube.slice(cities=[selected_city])
+    if city_cube.empty:
         fig = go.Figure()
         fig.update_layout(
             title=f"{selected_city} - No Data Available", 
@@ -851,7 +852,7 @@ def update_city_brand_chart(selected_city):
         )
         return fig
 
-    brand_counts = city_data['Make'].value_counts().head(8)
+    brand_counts = cube_counts(city_cube, 'Make').head(8)
     if brand_counts.empty:
         fig = go.Figure()
         fig.update_layout(
@@ -885,7 +886,7 @@ def update_city_brand_chart(selected_city):
     fig.update_layout(
         height=600,
         title={
-            'text': f'{selected_city} - Top 8 EV Brands<br><span style="font-size:14px; color:#666">Total Vehicles: {len(city_data):,}</span>',
+            'text': f'{selected_city} - Top 8 EV Brands<br><span style="font-size:14px; color:#666">Total Vehicles: {city_cube["Count"].sum():,}</span>',
             'x': 0.5,
             'xanchor': 'center',
             'font': {'size': 18, 'color': '#2E4057'}
@@ -912,45 +913,42 @@ def update_city_brand_chart(selected_city):
 
 @app.callback(
     Output('heatmap-chart', 'figure'),
-    [Input('city-dropdown', 'value')]  # 可以用城市下拉过滤，或者用全局数据
+    [Input('heatmap-highlight', 'value'),
+     Input('city-dropdown', 'value')]
 )
-def update_heatmap(selected_city):
-    # 取城市和品牌前5
-    top_brands = df_total['Make'].value_counts().head(5).index.tolist()
-    heatmap_df = df_total[df_total['Make'].isin(top_brands)]
-    
-    # 过滤主要城市
-    heatmap_df = heatmap_df[heatmap_df['City'].isin(available_cities)]
-    
-    if len(heatmap_df) == 0:
+def update_heatmap(highlight, selected_city):
+    # 不高亮时热力图和城市下拉无关，切换城市不重画
+    if not highlight and ctx.triggered_id == 'city-dropdown':
+        raise PreventUpdate
+    return heatmap_figure(selected_city if highlight else None)
+
+
+@figure_cache.memoize(f'heatmap-chart:{heatmap_top_n}:{heatmap_city_setting}')  # 配置不同的热力图分开缓存
+def heatmap_figure(highlight_city=None):
+    # 市场份额矩阵启动时已经算好（heatmap_matrix），这里只画图
+    if heatmap_matrix.empty:
         return go.Figure()  # 空图表
     
-    # 计算市场份额 %
-    heatmap_df = heatmap_df.groupby(['City', 'Make']).size().reset_index(name='Count')
-    city_totals = heatmap_df.groupby('City')['Count'].sum().reset_index(name='Total')
-    heatmap_df = heatmap_df.merge(city_totals, on='City')
-    heatmap_df['Market_Share'] = heatmap_df['Count'] / heatmap_df['Total'] * 100
-    
-    # 生成透视表
-    pivot_df = heatmap_df.pivot(index='City', columns='Make', values='Market_Share').fillna(0)
-    
     fig = px.imshow(
-        pivot_df,
-        title='Market Share of Top 5 EV Brands Across Major WA Cities (%)',
+        heatmap_matrix,
+        title=f'{heatmap_title} (%)',
         color_continuous_scale='Blues',
         aspect="auto"
     )
     
-    # 添加百分比标注
-    for i, row in enumerate(pivot_df.values):
-        for j, value in enumerate(row):
-            fig.add_annotation(
-                x=j,
-                y=i,
-                text=f'{value:.1f}%',
-                showarrow=False,
-                font=dict(color='white' if value > 50 else 'black', size=10)
-            )
+    # 百分比标注直接用热力图自己的文字，单元格再多也只是一个 trace；
+    # 不指定文字颜色时 Plotly 会按格子深浅自动选黑/白
+    fig.update_traces(texttemplate='%{z:.1f}%', textfont_size=10)
+    
+    # 高亮模式：给选中城市那一行加边框
+    if highlight_city in heatmap_matrix.index:
+        row = heatmap_matrix.index.get_loc(highlight_city)
+        fig.add_shape(
+            type='rect',
+            x0=-0.5, x1=len(heatmap_matrix.columns) - 0.5,
+            y0=row - 0.5, y1=row + 0.5,
+            line=dict(color='#E74C3C', width=3)
+        )
     
     fig.update_layout(
         xaxis_title='EV Brand',
@@ -962,6 +960,28 @@ def update_heatmap(selected_city):
     return fig
 
 
+def dropdown_values(component_id):
+    return [option['value'] for option in app.layout[component_id].options]
+
+
+def warm_up_figures(workers=None):
+    # 启动前把所有下拉组合的图表预先画好放进共享缓存，第一个用户也不用等
+    cities = dropdown_values('city-dropdown')
+    jobs = (
+        combinations(update_range_chart, dropdown_values('range-year-dropdown'), dropdown_values('range-chart-dropdown'))
+        + combinations(
+            update_thematic_map,
+            dropdown_values('bubble-year-dropdown'),
+            dropdown_values('bubble-make-dropdown'),
+            dropdown_values('bubble-level-dropdown'),
+        )
+        + combinations(update_brand_chart, dropdown_values('brand-year-dropdown'))
+        + combinations(update_city_brand_chart, cities)
+        + combinations(heatmap_figure, [None] + cities)
+    )
+    rendered = warm_up(figure_cache, __name__, jobs, workers)
+    print(f"🔥 Figure cache warmed: {rendered} of {len(jobs)} figures rendered")
+
 
 if __name__ == '__main__':
     print("🌐 启动华盛顿州电动汽车综合分析统一网站...")
@@ -974,6 +994,8 @@ if __name__ == '__main__':
     print("\n🌐 网站将在浏览器中自动打开...")
     print("🔗 如果浏览器没有自动打开，请访问: http://127.0.0.1:8050")
 
+    warm_up_figures(int(os.environ.get('EV_WARM_UP_WORKERS', 0)) or None)
+
     # 启动 Dash 网站
     app.run(host="0.0.0.0", port=8050, debug=True)
 
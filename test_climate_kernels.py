@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+
+from bench_climate import synthetic_readings
+from climate_kernels import check_parity
+
+
+def test_backends_agree():
+    check_parity(synthetic_readings(stations=12, regions=3, days=3, freq='7min'))
+
+
+def test_backends_agree_with_missing_values():
+    records = synthetic_readings(stations=12, regions=3, days=3, freq='7min', seed=1)
+    for column, step in [('temperature', 7), ('wind_speed', 11), ('pressure', 13), ('humidity', 17)]:
+        for record in records[::step]:
+            record[column] = np.nan
+    check_parity(records)